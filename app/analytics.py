@@ -0,0 +1,164 @@
+import threading
+from collections import namedtuple
+import numpy as np
+from .models import db, User
+from .scoring import grade_matrix
+
+# Voters with fewer grades than this are left out of the similarity analysis
+MIN_GRADES = 3
+# At most this many voting blocs, each of about BLOC_SIZE voters
+MAX_BLOCS = 6
+BLOC_SIZE = 8
+KMEANS_ITERATIONS = 25
+# Number of most alike and most opposed pairs listed
+TOP_PAIRS = 10
+
+StageAnalytics = namedtuple('StageAnalytics', [
+    'user_ids',     # voters included in the analysis, as a NumPy array
+    'names',        # {user_id: username}
+    'vectors',      # unit-length mean-centred grade rows, one per included voter
+    'alike',        # [(user_id, user_id, similarity)] most alike first
+    'opposed',      # [(user_id, user_id, similarity)] most opposed first
+    'blocs',        # [Bloc] largest first
+    'contrarian',   # (user_id, mean similarity to everyone else) or None
+    'mainstream',   # (user_id, mean similarity to everyone else) or None
+    'skipped',      # voters with fewer than MIN_GRADES grades
+])
+Bloc = namedtuple('Bloc', ['user_ids', 'cohesion', 'favorites'])
+
+_analytics_cache = {}
+_analytics_lock = threading.Lock()
+
+
+def centered_vectors(matrix):
+    """Mean-centre each voter's grades and scale the rows to unit length.
+
+    Ungraded countries count as the voter's own average, so the dot product
+    of two rows is the correlation of their grades. Returns (keep, vectors),
+    where keep marks the rows of matrix that have enough varied grades.
+    """
+    graded = matrix > 0
+    counts = graded.sum(axis=1)
+    means = matrix.sum(axis=1) / np.maximum(counts, 1)
+    centered = np.where(graded, matrix - means[:, None], 0.0)
+    norms = np.linalg.norm(centered, axis=1)
+    keep = (counts >= MIN_GRADES) & (norms > 0)
+    return keep, centered[keep] / norms[keep, None]
+
+
+def top_pairs(similarity, count, highest=True):
+    """The count most (or least) similar distinct pairs as (row, row, similarity)"""
+    rows, columns = np.triu_indices(len(similarity), 1)
+    values = similarity[rows, columns]
+    if not len(values):
+        return []
+    count = min(count, len(values))
+    keys = -values if highest else values
+    picked = np.argpartition(keys, count - 1)[:count]
+    picked = picked[np.argsort(keys[picked], kind='stable')]
+    return [(int(rows[index]), int(columns[index]), float(values[index])) for index in picked]
+
+
+def voting_blocs(vectors):
+    """Group voters into blocs with spherical k-means; returns a bloc label per row.
+
+    Centres start from the voter closest to the overall taste and then, one
+    by one, the voter least like any centre so far, so results are repeatable.
+    """
+    count = len(vectors)
+    blocs = max(1, min(MAX_BLOCS, count // BLOC_SIZE))
+    overall = vectors.sum(axis=0)
+    centres = [vectors[np.argmax(vectors @ overall)]]
+    for _ in range(blocs - 1):
+        closest = (vectors @ np.array(centres).T).max(axis=1)
+        centres.append(vectors[np.argmin(closest)])
+    centres = np.array(centres)
+
+    labels = np.full(count, -1)
+    for _ in range(KMEANS_ITERATIONS):
+        new_labels = np.argmax(vectors @ centres.T, axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centres)
+        np.add.at(sums, labels, vectors)
+        norms = np.linalg.norm(sums, axis=1)
+        # A bloc that lost all its voters keeps its old centre
+        filled = norms > 0
+        centres[filled] = sums[filled] / norms[filled, None]
+    return labels
+
+
+def stage_analytics(stage_id):
+    """Similarity, blocs and outliers of a stage's voters from one users × countries matrix"""
+    user_ids, country_ids, matrix = grade_matrix(stage_id)
+    keep, vectors = centered_vectors(matrix)
+    included = user_ids[keep]
+    names = dict(db.session.query(User.id, User.username).filter(User.id.in_(included.tolist())).all()) \
+        if len(included) else {}
+
+    similarity = vectors @ vectors.T
+    alike, opposed = [
+        [(int(included[row]), int(included[column]), value)
+         for row, column, value in top_pairs(similarity, TOP_PAIRS, highest)]
+        for highest in (True, False)
+    ]
+
+    contrarian = mainstream = None
+    if len(included) > 1:
+        # Mean similarity to everyone else; the diagonal is always 1
+        agreement = (similarity.sum(axis=1) - 1) / (len(included) - 1)
+        contrarian = (int(included[np.argmin(agreement)]), float(agreement.min()))
+        mainstream = (int(included[np.argmax(agreement)]), float(agreement.max()))
+
+    blocs = []
+    if len(included) >= 2:
+        labels = voting_blocs(vectors)
+        kept_matrix = matrix[keep]
+        for label in np.unique(labels):
+            members = np.flatnonzero(labels == label)
+            if len(members) < 2:
+                continue
+            block = similarity[np.ix_(members, members)]
+            cohesion = float((block.sum() - len(members)) / (len(members) * (len(members) - 1)))
+            grades = kept_matrix[members]
+            graded = (grades > 0).sum(axis=0)
+            average = np.where(graded > 0, grades.sum(axis=0) / np.maximum(graded, 1), 0)
+            favorites = [int(country_ids[index]) for index in np.argsort(-average, kind='stable')[:3]
+                         if average[index] > 0]
+            blocs.append(Bloc([int(user_id) for user_id in included[members]], cohesion, favorites))
+        blocs.sort(key=lambda bloc: (-len(bloc.user_ids), -bloc.cohesion))
+
+    return StageAnalytics(included, names, vectors, alike, opposed, blocs,
+                          contrarian, mainstream, int((~keep).sum()))
+
+
+def get_stage_analytics(stage_id, db_version=None):
+    """stage_analytics for a stage, reused while its shared stage version is unchanged"""
+    if db_version is not None:
+        with _analytics_lock:
+            cached = _analytics_cache.get(stage_id)
+        if cached is not None and cached[0] == db_version:
+            return cached[1]
+    analytics = stage_analytics(stage_id)
+    if db_version is not None:
+        with _analytics_lock:
+            _analytics_cache[stage_id] = (db_version, analytics)
+    return analytics
+
+
+def invalidate_stage_analytics(stage_id):
+    """Forget the cached analytics of a stage"""
+    with _analytics_lock:
+        _analytics_cache.pop(stage_id, None)
+
+
+def closest_voters(analytics, user_id, count=3):
+    """The count voters most similar to user_id as [(user_id, similarity)], or [] if not analysed"""
+    rows = np.flatnonzero(analytics.user_ids == user_id)
+    if not len(rows) or len(analytics.user_ids) < 2:
+        return []
+    similarity = analytics.vectors @ analytics.vectors[rows[0]]
+    similarity[rows[0]] = -np.inf
+    picked = np.argsort(-similarity, kind='stable')[:count]
+    return [(int(analytics.user_ids[index]), float(similarity[index])) for index in picked]
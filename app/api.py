@@ -0,0 +1,275 @@
+from flask import request, session, jsonify
+from werkzeug.exceptions import NotFound
+from .models import db, User, Stage, Country, StageCountry, CurrentGrade
+from .scoreboard import get_scoreboard
+from .scoring import SCORING_MODES, scoring_mode, get_points_totals
+from .leaderboard import global_version, get_leaderboard
+from .country_flags import get_flag_emoji
+from .versions import (USERS_KEY, stage_key, lineup_key, get_versions, version_sum,
+                       make_etag, not_modified, with_etag)
+
+API_PREFIX = '/api/v1'
+# Page size for keyset-paginated lists
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+STAGE_FIELDS = ['id', 'name', 'countries']
+LINEUP_FIELDS = ['order', 'id', 'name', 'artist', 'song', 'flag']
+RANKING_FIELDS = ['position', 'country_id', 'name', 'flag', 'total']
+BALLOT_FIELDS = ['country_id', 'name', 'flag', 'value']
+BALLOTS_FIELDS = ['user_id', 'username', 'votes', 'grades']
+LEADERBOARD_FIELDS = ['id', 'name', 'flag', 'total', 'votes', 'average', 'stages']
+VOTERS_FIELDS = ['user_id', 'username', 'votes', 'participated', 'stages']
+
+
+class ApiError(Exception):
+    """Error answered with {"error": message} and the given status code"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _selected_fields(available):
+    """Fields requested with ?fields=a,b (all fields by default), in the requested order"""
+    requested = request.args.get('fields')
+    if not requested:
+        return available
+    fields = [field.strip() for field in requested.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ApiError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(available)}")
+    return fields
+
+
+def _payload(records, available, **extra):
+    """Shape records as {"data": [{...}]} or, with ?format=compact, {"fields": [...], "rows": [[...]]}"""
+    fields = _selected_fields(available)
+    output_format = request.args.get('format', 'full')
+    if output_format == 'compact':
+        payload = {'fields': fields, 'rows': [[record[field] for field in fields] for record in records]}
+    elif output_format == 'full':
+        payload = {'data': [{field: record[field] for field in fields} for record in records]}
+    else:
+        raise ApiError("format must be 'full' or 'compact'")
+    payload.update(extra)
+    return payload
+
+
+def _conditional(*parts):
+    """ETag for this URL (including fields, format and paging) and the given versions"""
+    return make_etag('api', request.full_path, *parts)
+
+
+def _lineup(stage_id):
+    """(order, Country) pairs of a stage in performance order"""
+    return (
+        db.session.query(StageCountry.order, Country)
+        .join(Country, Country.id == StageCountry.country_id)
+        .filter(StageCountry.stage_id == stage_id)
+        .order_by(StageCountry.order, Country.id)
+        .all()
+    )
+
+
+def _positive_int(name, default=None, maximum=None):
+    raw_value = request.args.get(name)
+    if raw_value is None:
+        return default
+    try:
+        value = int(raw_value)
+    except ValueError:
+        raise ApiError(f"{name} must be an integer")
+    if value < 0 or (maximum is not None and value > maximum):
+        raise ApiError(f"{name} must be between 0 and {maximum}" if maximum else f"{name} must not be negative")
+    return value
+
+
+def configure_api(app):
+    # Read-only JSON API for thin clients and big-screen displays.
+    # Every list supports ?fields=a,b and ?format=compact, and every response
+    # carries an ETag, so polling an unchanged resource costs a 304.
+
+    @app.errorhandler(ApiError)
+    def api_error(error):
+        return jsonify({'error': error.message}), error.status
+
+    @app.errorhandler(NotFound)
+    def api_not_found(error):
+        # Keep the regular HTML 404 page outside the API
+        if request.path.startswith(API_PREFIX + '/'):
+            return jsonify({'error': "Not found"}), 404
+        return error
+
+    @app.before_request
+    def api_login_required():
+        if request.path.startswith(API_PREFIX + '/') and 'user_id' not in session:
+            return jsonify({'error': "Please log in to use the API"}), 401
+
+    @app.route(f'{API_PREFIX}/stages')
+    def api_stages():
+        """All stages with the size of their lineup"""
+        etag = _conditional(version_sum('lineup:'))
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        rows = (
+            db.session.query(Stage.id, Stage.display_name, db.func.count(StageCountry.country_id))
+            .outerjoin(StageCountry, StageCountry.stage_id == Stage.id)
+            .group_by(Stage.id, Stage.display_name)
+            .order_by(Stage.id)
+            .all()
+        )
+        records = [{'id': stage_id, 'name': name, 'countries': countries}
+                   for stage_id, name, countries in rows]
+        return with_etag(jsonify(_payload(records, STAGE_FIELDS)), etag)
+
+    @app.route(f'{API_PREFIX}/stages/<int:stage_id>/lineup')
+    def api_lineup(stage_id):
+        """Countries of a stage in performance order"""
+        version = get_versions(lineup_key(stage_id))[lineup_key(stage_id)]
+        etag = _conditional(version)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        stage = db.get_or_404(Stage, stage_id)
+        records = [{'order': order, 'id': country.id, 'name': country.display_name,
+                    'artist': country.artist, 'song': country.song,
+                    'flag': get_flag_emoji(country.display_name)}
+                   for order, country in _lineup(stage_id)]
+        return with_etag(jsonify(_payload(records, LINEUP_FIELDS, stage_id=stage.id,
+                                          lineup_version=version)), etag)
+
+    @app.route(f'{API_PREFIX}/stages/<int:stage_id>/rankings')
+    def api_rankings(stage_id):
+        """Current rankings of a stage, highest total first (?scoring=grades|points)"""
+        version = get_versions(stage_key(stage_id))[stage_key(stage_id)]
+        etag = _conditional(version)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        stage = db.get_or_404(Stage, stage_id)
+        requested = request.args.get('scoring')
+        if requested is not None and requested not in SCORING_MODES:
+            raise ApiError(f"scoring must be one of: {', '.join(SCORING_MODES)}")
+        scoring = scoring_mode(stage, requested)
+        if scoring == 'points':
+            totals = get_points_totals(stage_id, version)
+        else:
+            _, totals = get_scoreboard(stage_id, version).snapshot()
+        names = {country.id: country.display_name for _, country in _lineup(stage_id)}
+        records = [{'position': position, 'country_id': country_id, 'name': names.get(country_id),
+                    'flag': get_flag_emoji(names.get(country_id)), 'total': total}
+                   for position, (country_id, total) in enumerate(totals, 1)]
+        return with_etag(jsonify(_payload(records, RANKING_FIELDS, stage_id=stage_id,
+                                          scoring=scoring, version=version)), etag)
+
+    @app.route(f'{API_PREFIX}/stages/<int:stage_id>/ballots')
+    def api_ballots(stage_id):
+        """Every user's current grades for a stage, paginated by user id.
+
+        Pass ?after=<next_after of the previous page> to continue; the page size
+        is ?limit= (default DEFAULT_LIMIT, at most MAX_LIMIT).
+        """
+        versions = get_versions(stage_key(stage_id), USERS_KEY)
+        etag = _conditional(versions[stage_key(stage_id)], versions[USERS_KEY])
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        db.get_or_404(Stage, stage_id)
+        after = _positive_int('after', 0)
+        limit = _positive_int('limit', DEFAULT_LIMIT, MAX_LIMIT) or DEFAULT_LIMIT
+
+        # Keyset pagination: seek past the last user id instead of counting an OFFSET
+        users = (
+            db.session.query(User.id, User.username)
+            .filter(User.id > after)
+            .order_by(User.id)
+            .limit(limit + 1)
+            .all()
+        )
+        has_more = len(users) > limit
+        users = users[:limit]
+
+        grades = {user_id: {} for user_id, _ in users}
+        if users:
+            for user_id, country_id, value in (
+                db.session.query(CurrentGrade.user_id, CurrentGrade.country_id, CurrentGrade.value)
+                # Only countries of the lineup, as in rankings, leaderboard and analytics
+                .join(StageCountry, db.and_(StageCountry.stage_id == CurrentGrade.stage_id,
+                                            StageCountry.country_id == CurrentGrade.country_id))
+                .filter(CurrentGrade.stage_id == stage_id,
+                        CurrentGrade.user_id.in_(list(grades)))
+                .all()
+            ):
+                grades[user_id][country_id] = value
+
+        records = [{'user_id': user_id, 'username': username, 'votes': len(grades[user_id]),
+                    'grades': [[country_id, value] for country_id, value in sorted(grades[user_id].items())]}
+                   for user_id, username in users]
+        return with_etag(jsonify(_payload(records, BALLOTS_FIELDS, stage_id=stage_id,
+                                          version=versions[stage_key(stage_id)],
+                                          next_after=users[-1][0] if has_more else None)), etag)
+
+    @app.route(f'{API_PREFIX}/stages/<int:stage_id>/ballots/<int:user_id>')
+    def api_ballot(stage_id, user_id):
+        """One user's current grades for a stage, highest first (what user_votes shows)"""
+        version = get_versions(stage_key(stage_id))[stage_key(stage_id)]
+        etag = _conditional(version)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        db.get_or_404(Stage, stage_id)
+        user = db.get_or_404(User, user_id)
+        rows = (
+            db.session.query(Country, CurrentGrade.value)
+            .join(CurrentGrade, CurrentGrade.country_id == Country.id)
+            .filter(CurrentGrade.user_id == user_id, CurrentGrade.stage_id == stage_id)
+            .order_by(CurrentGrade.value.desc(), Country.id)
+            .all()
+        )
+        records = [{'country_id': country.id, 'name': country.display_name,
+                    'flag': get_flag_emoji(country.display_name), 'value': value}
+                   for country, value in rows]
+        return with_etag(jsonify(_payload(records, BALLOT_FIELDS, stage_id=stage_id,
+                                          user_id=user.id, username=user.username,
+                                          version=version)), etag)
+
+    @app.route(f'{API_PREFIX}/leaderboard')
+    def api_leaderboard():
+        """Combined standings across all stages, with [stage_id, total, votes] per stage"""
+        version = global_version()
+        etag = _conditional(version)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        leaderboard = get_leaderboard(version)
+        records = [{'id': country.id, 'name': country.name, 'flag': country.flag,
+                    'total': country.total, 'votes': country.votes, 'average': country.average,
+                    'stages': [[stage_id, total, votes] for stage_id, (total, votes) in sorted(country.stages.items())]}
+                   for country in leaderboard.countries]
+        stages = [{'id': stage_id, 'name': name, 'countries': size} for stage_id, name, size in leaderboard.stages]
+        return with_etag(jsonify(_payload(records, LEADERBOARD_FIELDS, stages=stages, version=version)), etag)
+
+    @app.route(f'{API_PREFIX}/leaderboard/voters')
+    def api_leaderboard_voters():
+        """Every voter's number of grades per stage, most stages first"""
+        version = global_version()
+        etag = _conditional(version)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        leaderboard = get_leaderboard(version)
+        records = [{'user_id': voter.id, 'username': voter.username, 'votes': voter.votes,
+                    'participated': voter.participated,
+                    'stages': [[stage_id, votes] for stage_id, votes in sorted(voter.stages.items())]}
+                   for voter in leaderboard.voters]
+        return with_etag(jsonify(_payload(records, VOTERS_FIELDS, version=version)), etag)
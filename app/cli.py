@@ -0,0 +1,161 @@
+import os
+import time
+import click
+from .models import db, Stage, Grade, GradeArchive, CurrentGrade
+from .schema import ensure_columns, ensure_indexes, migrate_association_table
+from .versions import USERS_KEY, stage_key, lineup_key, bump_versions
+
+
+def _elapsed(started):
+    return f"{(time.perf_counter() - started) * 1000:.0f} ms"
+
+
+def migrate_database():
+    """Bring an existing schema up to date; every step is safe to repeat"""
+    # Tables added since the database was created, e.g. current_grade on a baseline database
+    db.create_all()
+
+    migrated = migrate_association_table()
+    if migrated is not None:
+        print(f"✅ Migrated {migrated} associations from the old association table to StageCountry")
+
+    # Add columns and indexes added to the models after the tables were created
+    added_columns = ensure_columns()
+    if added_columns:
+        print(f"✅ Added missing columns: {', '.join(added_columns)}")
+
+    created_indexes = ensure_indexes()
+    if created_indexes:
+        print(f"✅ Created missing indexes: {', '.join(created_indexes)}")
+
+    # Backfill the current_grade read model from the Grade history if it is empty
+    if CurrentGrade.query.first() is None and Grade.query.first() is not None:
+        from .grades import backfill_current_grades
+        print("🔄 Backfilling current grades from grade history")
+        backfilled = backfill_current_grades()
+        print(f"✅ Backfill complete: {backfilled} current grades")
+
+
+def seed_database(force=False):
+    """Fill an empty database with Eurovision data. Returns True if it seeded"""
+    from .db_init import initialize_database
+
+    if Stage.query.count() > 0 and not force:
+        print("ℹ️ Database already contains data - skipping seeding")
+        return False
+    initialize_database()
+    # Seeding changes every stage page, so cached copies must not be reused
+    stage_ids = [stage_id for (stage_id,) in db.session.query(Stage.id).all()]
+    bump_versions(USERS_KEY, *[key for stage_id in stage_ids
+                               for key in (stage_key(stage_id), lineup_key(stage_id))])
+    db.session.commit()
+    return True
+
+
+def _format_size(rows, size):
+    if size is None:
+        return f"{rows} rows"
+    return f"{rows} rows, {size / 1024 / 1024:.1f} MiB"
+
+
+def run_compaction(older_than, batch_size, drop, retention_days, pause):
+    """One compaction pass: move superseded grades, purge expired archive rows, report sizes"""
+    from .compaction import (compact_grades, purge_archive, table_sizes,
+                             archive_cutoff, retention_cutoff)
+
+    started = time.perf_counter()
+    # Databases created before the archive table existed get it here
+    GradeArchive.__table__.create(bind=db.engine, checkfirst=True)
+    before = table_sizes(Grade, GradeArchive)
+
+    moved = compact_grades(archive_cutoff(older_than), batch_size, drop, pause)
+    purged = 0
+    cutoff = retention_cutoff(retention_days)
+    if cutoff is not None:
+        purged = purge_archive(cutoff, batch_size)
+
+    after = table_sizes(Grade, GradeArchive)
+    action = "Deleted" if drop else "Archived"
+    print(f"✅ {action} {moved} grades superseded at least {older_than} min ago in {_elapsed(started)}")
+    if purged:
+        print(f"🗑️ Purged {purged} archived grades older than {retention_days} days")
+    for table in before:
+        print(f"   {table}: {_format_size(*before[table])} → {_format_size(*after[table])}")
+    return moved
+
+
+def register_commands(app):
+    # Register the database commands with the flask CLI
+    @app.cli.command('init-db')
+    @click.option('--seed/--no-seed', default=None,
+                  help="Seed an empty database with Eurovision data (default: AUTO_INIT_DB)")
+    def init_db(seed):
+        """Create missing tables, run migrations and optionally seed the database."""
+        started = time.perf_counter()
+        migrate_database()
+        if seed is None:
+            seed = os.getenv('AUTO_INIT_DB', '0') == '1'
+        if seed:
+            seed_database()
+        print(f"✅ Database ready in {_elapsed(started)}")
+
+    @app.cli.command('migrate-db')
+    def migrate_db():
+        """Migrate an existing database: new tables, old association table, indexes, current grades."""
+        started = time.perf_counter()
+        migrate_database()
+        print(f"✅ Migrations complete in {_elapsed(started)}")
+
+    @app.cli.command('seed-db')
+    @click.option('--force', is_flag=True, help="Seed even if the database already contains stages")
+    def seed_db(force):
+        """Fill the database with Eurovision data (real 2023 data with USE_REAL_EUROVISION_DATA=1)."""
+        started = time.perf_counter()
+        if seed_database(force):
+            print(f"✅ Seeding complete in {_elapsed(started)}")
+
+    @app.cli.command('set-scoring')
+    @click.argument('stage_id', type=int)
+    @click.argument('mode', type=click.Choice(['grades', 'points']))
+    def set_scoring(stage_id, mode):
+        """Choose how a stage is ranked by default: summed grades or Eurovision points."""
+        stage = db.session.get(Stage, stage_id)
+        if stage is None:
+            raise click.ClickException(f"Stage {stage_id} does not exist")
+        stage.scoring = mode
+        # Rankings change with the mode, so cached stage pages must not be reused
+        bump_versions(stage_key(stage_id))
+        db.session.commit()
+        print(f"✅ {stage.display_name} is now ranked by {mode}")
+
+    @app.cli.command('compact-grades')
+    @click.option('--older-than', type=int, default=None,
+                  help="Only touch grades superseded for at least this many minutes (default: GRADE_ARCHIVE_AFTER_MINUTES)")
+    @click.option('--batch-size', type=int, default=None,
+                  help="Rows moved per transaction (default: GRADE_COMPACT_BATCH_SIZE)")
+    @click.option('--drop', is_flag=True, help="Delete superseded grades instead of archiving them")
+    @click.option('--retention-days', type=int, default=None,
+                  help="Delete archived grades older than this many days, 0 keeps them (default: GRADE_ARCHIVE_RETENTION_DAYS)")
+    @click.option('--pause', type=float, default=0.0, help="Seconds to sleep between batches")
+    @click.option('--every', type=int, default=0,
+                  help="Keep running and compact again every N minutes")
+    def compact_grades_command(older_than, batch_size, drop, retention_days, pause, every):
+        """Move superseded grades out of the Grade table into grade_archive."""
+        from .compaction import ARCHIVE_AFTER_MINUTES, ARCHIVE_RETENTION_DAYS, COMPACT_BATCH_SIZE
+
+        older_than = ARCHIVE_AFTER_MINUTES if older_than is None else older_than
+        batch_size = batch_size or COMPACT_BATCH_SIZE
+        retention_days = ARCHIVE_RETENTION_DAYS if retention_days is None else retention_days
+        while True:
+            try:
+                run_compaction(older_than, batch_size, drop, retention_days, pause)
+            except Exception as e:
+                db.session.rollback()
+                if not every:
+                    raise
+                print(f"❌ Error compacting grades: {str(e)}")
+            finally:
+                db.session.remove()
+            if not every:
+                return
+            time.sleep(every * 60)
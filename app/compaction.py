@@ -0,0 +1,116 @@
+import os
+import time
+from datetime import datetime, timedelta
+from .models import db, Grade, GradeArchive
+
+# Grades superseded less than this long ago stay in the Grade table
+ARCHIVE_AFTER_MINUTES = int(os.getenv('GRADE_ARCHIVE_AFTER_MINUTES', '60'))
+# Archived grades older than this are deleted (0 keeps them forever)
+ARCHIVE_RETENTION_DAYS = int(os.getenv('GRADE_ARCHIVE_RETENTION_DAYS', '0'))
+# Rows moved per transaction; each batch holds its locks only briefly
+COMPACT_BATCH_SIZE = int(os.getenv('GRADE_COMPACT_BATCH_SIZE', '1000'))
+
+ARCHIVE_COLUMNS = ['id', 'value', 'user_id', 'stage_id', 'country_id', 'timestamp']
+
+
+def superseded_grades_query(cutoff):
+    """Select ids of Grade rows that a newer grade for the same key replaced before cutoff.
+
+    "Newer" uses the same (timestamp, id) order as latest_grades_subquery, so
+    the row it picks as the latest is never selected. The lookup of newer rows
+    is covered by ix_grade_user_stage_country_ts.
+    """
+    newer = db.aliased(Grade)
+    replaced = (
+        db.select(newer.id)
+        .where(
+            newer.user_id == Grade.user_id,
+            newer.stage_id == Grade.stage_id,
+            newer.country_id == Grade.country_id,
+            newer.timestamp < cutoff,
+            db.or_(newer.timestamp > Grade.timestamp,
+                   db.and_(newer.timestamp == Grade.timestamp, newer.id > Grade.id))
+        )
+        .exists()
+    )
+    # A row replaced before cutoff is itself older than cutoff, which narrows the scan by timestamp
+    return db.select(Grade.id).where(Grade.timestamp < cutoff, replaced).order_by(Grade.id)
+
+
+def compact_batch(cutoff, batch_size, drop=False):
+    """Archive (or with drop=True delete) one batch of superseded grades. Returns the row count"""
+    ids = db.session.execute(superseded_grades_query(cutoff).limit(batch_size)).scalars().all()
+    if not ids:
+        return 0
+    if not drop:
+        columns = [getattr(Grade, column) for column in ARCHIVE_COLUMNS]
+        db.session.execute(
+            db.insert(GradeArchive).from_select(
+                ARCHIVE_COLUMNS + ['archived_at'],
+                db.select(*columns, db.literal(datetime.utcnow(), db.DateTime)).where(Grade.id.in_(ids))
+            )
+        )
+    db.session.execute(db.delete(Grade).where(Grade.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
+
+
+def compact_grades(cutoff, batch_size=COMPACT_BATCH_SIZE, drop=False, pause=0.0):
+    """Move every grade superseded before cutoff out of Grade, one short transaction per batch"""
+    moved = 0
+    while True:
+        count = compact_batch(cutoff, batch_size, drop)
+        moved += count
+        if count < batch_size:
+            return moved
+        if pause:
+            # Give live traffic room between batches
+            time.sleep(pause)
+
+
+def purge_archive(cutoff, batch_size=COMPACT_BATCH_SIZE):
+    """Delete archived grades archived before cutoff, in batches. Returns the row count"""
+    purged = 0
+    while True:
+        ids = db.session.execute(
+            db.select(GradeArchive.id).where(GradeArchive.archived_at < cutoff).limit(batch_size)
+        ).scalars().all()
+        if ids:
+            db.session.execute(db.delete(GradeArchive).where(GradeArchive.id.in_(ids)))
+            db.session.commit()
+        purged += len(ids)
+        if len(ids) < batch_size:
+            return purged
+
+
+def table_sizes(*models):
+    """Return {table: (rows, bytes)} for the given models; bytes include indexes and is None if unknown"""
+    dialect = db.engine.dialect.name
+    sizes = {}
+    for model in models:
+        table = model.__tablename__
+        rows = db.session.query(db.func.count()).select_from(model).scalar()
+        size = None
+        try:
+            if dialect == 'postgresql':
+                size = db.session.execute(
+                    db.text("SELECT pg_total_relation_size(CAST(:table AS regclass))"), {'table': table}
+                ).scalar()
+            elif dialect == 'sqlite':
+                # dbstat is only available when SQLite was built with it
+                size = db.session.execute(db.text(
+                    "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                    "(SELECT name FROM sqlite_master WHERE tbl_name = :table)"
+                ), {'table': table}).scalar()
+        except Exception:
+            db.session.rollback()
+        sizes[table] = (rows, size)
+    return sizes
+
+
+def archive_cutoff(minutes=ARCHIVE_AFTER_MINUTES):
+    return datetime.utcnow() - timedelta(minutes=minutes)
+
+
+def retention_cutoff(days=ARCHIVE_RETENTION_DAYS):
+    return datetime.utcnow() - timedelta(days=days) if days else None
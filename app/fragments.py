@@ -0,0 +1,103 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from flask import get_template_attribute
+from markupsafe import Markup
+from .models import db, Country, StageCountry
+from .country_flags import get_flag_emoji
+
+# Upper bound on the characters of rendered HTML kept per process
+FRAGMENT_CACHE_CHARS = int(os.getenv('FRAGMENT_CACHE_CHARS', str(2 * 1024 * 1024)))
+
+# Stand-in for Country in templates and ranking_items, detached from any session
+LineupCountry = namedtuple('LineupCountry', ['id', 'display_name', 'artist', 'song', 'order', 'flag'])
+# Lineup of a stage with the pre-rendered static cells of each voting row
+StageLineup = namedtuple('StageLineup', ['countries', 'cells', 'lineup', 'size'])
+
+
+class FragmentCache:
+    """Size-capped LRU cache of rendered template fragments.
+
+    Keys must include every version the fragment depends on, so an entry is
+    never invalidated, only pushed out by newer ones. Each entry is charged
+    its ``size`` and the least recently used entries are evicted once the
+    total exceeds ``max_size``.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                return
+            if size > self.max_size:
+                # Larger than the whole cache; serve it without keeping it
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self.entries), 'size': self.size}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_CHARS)
+
+
+def _render_lineup(stage_id):
+    """Query a stage lineup and render the static cells of its voting rows"""
+    rows = (
+        db.session.query(Country, StageCountry.order)
+        .join(StageCountry, Country.id == StageCountry.country_id)
+        .filter(StageCountry.stage_id == stage_id)
+        .order_by(StageCountry.order)
+        .all()
+    )
+    countries = [LineupCountry(country.id, country.display_name, country.artist, country.song,
+                               order, get_flag_emoji(country.display_name))
+                 for country, order in rows]
+    render_cells = get_template_attribute('_lineup_cells.html', 'lineup_cells')
+    cells = {country.id: Markup(render_cells(country)) for country in countries}
+    lineup = [{'id': country.id, 'name': country.display_name, 'flag': country.flag}
+              for country in countries]
+    size = sum(len(html) for html in cells.values()) + sum(
+        len(country.display_name) + len(country.artist) + len(country.song) for country in countries)
+    return StageLineup(countries, cells, lineup, size)
+
+
+def get_stage_lineup(stage_id, lineup_version):
+    """Return the StageLineup of a stage at a lineup version, rendering it on a miss"""
+    key = ('lineup', stage_id, lineup_version)
+    stage_lineup = fragment_cache.get(key)
+    if stage_lineup is not None:
+        return stage_lineup
+    stage_lineup = _render_lineup(stage_id)
+    fragment_cache.put(key, stage_lineup, stage_lineup.size)
+    return stage_lineup
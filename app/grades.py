@@ -0,0 +1,194 @@
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from .models import db, Grade, CurrentGrade
+
+
+def dialect_insert(model):
+    """Return an INSERT construct that supports ON CONFLICT for the active database"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model)
+    if dialect == 'sqlite':
+        return sqlite.insert(model)
+    return None
+
+
+def upsert_current_grades(rows):
+    """Insert or update current grades in one statement without committing.
+
+    Each row is a dict with user_id, stage_id, country_id, value and timestamp.
+    """
+    if not rows:
+        return
+    stmt = dialect_insert(CurrentGrade)
+    if stmt is None:
+        # Other databases: fall back to the ORM merge (SELECT + INSERT/UPDATE)
+        for row in rows:
+            db.session.merge(CurrentGrade(**row))
+        return
+
+    stmt = stmt.values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'stage_id', 'country_id'],
+        set_={'value': stmt.excluded.value, 'timestamp': stmt.excluded.timestamp}
+    )
+    db.session.execute(stmt)
+
+
+def record_grades(user_id, stage_id, values, skip_unchanged=False):
+    """Append grades to the history and update the current grades in the same transaction.
+
+    values maps country_id to grade. Previous values are read in one query,
+    the history rows are written with one bulk INSERT and the current grades
+    with one upsert. With skip_unchanged=True, grades equal to the current
+    value are not written at all.
+
+    Returns a list of (country_id, previous_value, new_value) for every grade
+    written; previous_value is None for a user's first grade for a country.
+    The caller is responsible for committing the session.
+    """
+    if not values:
+        return []
+
+    previous = dict(
+        db.session.query(CurrentGrade.country_id, CurrentGrade.value)
+        .filter(
+            CurrentGrade.user_id == user_id,
+            CurrentGrade.stage_id == stage_id,
+            CurrentGrade.country_id.in_(list(values))
+        )
+        .with_for_update()
+        .all()
+    )
+
+    timestamp = datetime.utcnow()
+    changes = []
+    rows = []
+    for country_id, value in values.items():
+        if skip_unchanged and previous.get(country_id) == value:
+            continue
+        changes.append((country_id, previous.get(country_id), value))
+        rows.append({
+            'user_id': user_id,
+            'stage_id': stage_id,
+            'country_id': country_id,
+            'value': value,
+            'timestamp': timestamp
+        })
+
+    if rows:
+        db.session.execute(db.insert(Grade), rows)
+        upsert_current_grades(rows)
+    return changes
+
+
+def record_grade(user_id, stage_id, country_id, value):
+    """Append a single grade to the history and update the current grade.
+
+    Returns the previous current value (None if this is the user's first grade
+    for the country). The caller is responsible for committing the session.
+    """
+    _, previous, _ = record_grades(user_id, stage_id, {country_id: value})[0]
+    return previous
+
+
+def record_vote_batch(votes):
+    """Write a batch of buffered votes from any users and stages in one transaction.
+
+    votes are Vote tuples in submission order. Every vote is appended to the
+    history with its own timestamp, except skip_unchanged votes equal to the
+    value they replace; the current grades get the last value per user and
+    country with one upsert.
+
+    Returns {stage_id: [(country_id, previous_value, new_value), ...]} with one
+    entry per user and country whose current grade changed, previous_value
+    being the committed value before the batch. The caller commits.
+    """
+    keys = {(vote.user_id, vote.stage_id, vote.country_id) for vote in votes}
+    previous = {
+        (user_id, stage_id, country_id): value
+        for user_id, stage_id, country_id, value in
+        db.session.query(CurrentGrade.user_id, CurrentGrade.stage_id, CurrentGrade.country_id, CurrentGrade.value)
+        .filter(db.tuple_(CurrentGrade.user_id, CurrentGrade.stage_id, CurrentGrade.country_id).in_(list(keys)))
+        .with_for_update()
+        .all()
+    }
+
+    current = dict(previous)
+    rows = []
+    latest = {}
+    for vote in votes:
+        key = (vote.user_id, vote.stage_id, vote.country_id)
+        if vote.skip_unchanged and current.get(key) == vote.value:
+            continue
+        current[key] = vote.value
+        row = {
+            'user_id': vote.user_id,
+            'stage_id': vote.stage_id,
+            'country_id': vote.country_id,
+            'value': vote.value,
+            'timestamp': vote.timestamp
+        }
+        rows.append(row)
+        latest[key] = row
+
+    if rows:
+        db.session.execute(db.insert(Grade), rows)
+        upsert_current_grades(list(latest.values()))
+
+    changes = {}
+    for (_, stage_id, country_id), row in latest.items():
+        previous_value = previous.get((row['user_id'], stage_id, country_id))
+        if previous_value != row['value']:
+            changes.setdefault(stage_id, []).append((country_id, previous_value, row['value']))
+    return changes
+
+
+def latest_grades_subquery(stage_id=None):
+    """Latest Grade row per (user, stage, country), picked with ROW_NUMBER over the history"""
+    row_number = db.func.row_number().over(
+        partition_by=(Grade.stage_id, Grade.country_id, Grade.user_id),
+        order_by=(Grade.timestamp.desc(), Grade.id.desc())
+    ).label('rn')
+    ranked = db.session.query(
+        Grade.user_id,
+        Grade.stage_id,
+        Grade.country_id,
+        Grade.value,
+        Grade.timestamp,
+        row_number
+    )
+    if stage_id is not None:
+        ranked = ranked.filter(Grade.stage_id == stage_id)
+    ranked = ranked.subquery()
+    return (
+        db.select(
+            ranked.c.user_id,
+            ranked.c.stage_id,
+            ranked.c.country_id,
+            ranked.c.value,
+            ranked.c.timestamp
+        )
+        .where(ranked.c.rn == 1)
+        .subquery()
+    )
+
+
+def backfill_current_grades():
+    """Rebuild the current_grade table from the Grade history. Returns the number of rows written"""
+    latest = latest_grades_subquery()
+    CurrentGrade.query.delete()
+    db.session.execute(
+        db.insert(CurrentGrade).from_select(
+            ['user_id', 'stage_id', 'country_id', 'value', 'timestamp'],
+            db.select(
+                latest.c.user_id,
+                latest.c.stage_id,
+                latest.c.country_id,
+                latest.c.value,
+                latest.c.timestamp
+            )
+        )
+    )
+    db.session.commit()
+    return CurrentGrade.query.count()
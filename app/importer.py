@@ -0,0 +1,168 @@
+import csv
+import time
+from .models import db, Stage, Country, StageCountry
+from .grades import dialect_insert
+from .versions import stage_key, lineup_key, bump_versions
+
+
+REQUIRED_FIELDS = ['position', 'country', 'artist', 'song']
+
+
+def read_lineup_csv(text_stream):
+    """Parse a lineup CSV stream row by row.
+
+    Yields (line_number, row, error) for each data row: row is a dict with
+    the required fields when valid, otherwise None with a message in error.
+    A missing header yields a single error for line 1.
+    """
+    reader = csv.DictReader(text_stream)
+    missing = [field for field in REQUIRED_FIELDS if field not in (reader.fieldnames or [])]
+    if missing:
+        yield 1, None, f"CSV is missing required field: {', '.join(missing)}"
+        return
+
+    for row in reader:
+        line_number = reader.line_num
+        values = {field: (row.get(field) or '').strip() for field in REQUIRED_FIELDS}
+        empty = [field for field in ('country', 'artist', 'song') if not values[field]]
+        if empty:
+            yield line_number, None, f"Line {line_number}: missing {', '.join(empty)}"
+        else:
+            yield line_number, values, None
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def _normalize_rows(csv_rows):
+    """Turn CSV dicts into {country_name: (position, artist, song)}.
+
+    The position falls back to the row number when missing or invalid, and
+    a country listed twice keeps its last row.
+    """
+    lineup = {}
+    for index, row in enumerate(csv_rows, 1):
+        try:
+            position = int(row['position'].strip())
+            if position < 1:
+                position = index
+        except (ValueError, KeyError, AttributeError):
+            position = index
+        lineup[row['country'].strip()] = (position, row['artist'].strip(), row['song'].strip())
+    return lineup
+
+
+def import_lineup(stage_name, csv_rows, clear_existing=False):
+    """Load a stage lineup from CSV rows with set-based statements in one transaction.
+
+    Existing countries and stage associations are loaded with one query
+    each; new countries are added with one bulk INSERT, changed artists and
+    songs with one bulk UPDATE, and associations with one INSERT ... ON
+    CONFLICT DO UPDATE. Clearing the stage is a single DELETE. The stage and
+    lineup versions move for this stage and for every other stage showing a
+    country whose artist or song changed.
+
+    Returns (stage, stats) where stats holds the counts and per-phase
+    timings in milliseconds.
+    """
+    started = time.perf_counter()
+    timings = {}
+
+    phase = time.perf_counter()
+    lineup = _normalize_rows(csv_rows)
+    timings['parse_ms'] = _elapsed_ms(phase)
+
+    try:
+        phase = time.perf_counter()
+        stage = Stage.query.filter_by(display_name=stage_name).first()
+        if not stage:
+            stage = Stage(display_name=stage_name)
+            db.session.add(stage)
+            db.session.flush()
+
+        countries = {
+            country.display_name: country
+            for country in Country.query.filter(Country.display_name.in_(list(lineup))).all()
+        }
+        existing_associations = set()
+        if not clear_existing:
+            existing_associations = {
+                country_id for (country_id,) in
+                db.session.query(StageCountry.country_id).filter_by(stage_id=stage.id).all()
+            }
+        timings['load_ms'] = _elapsed_ms(phase)
+
+        phase = time.perf_counter()
+        if clear_existing:
+            db.session.execute(db.delete(StageCountry).where(StageCountry.stage_id == stage.id))
+
+        # Add new countries and collect their generated ids
+        new_countries = [
+            {'display_name': name, 'artist': artist, 'song': song}
+            for name, (_, artist, song) in lineup.items()
+            if name not in countries
+        ]
+        country_ids = {name: country.id for name, country in countries.items()}
+        if new_countries:
+            inserted = db.session.execute(
+                db.insert(Country).returning(Country.id, Country.display_name),
+                new_countries
+            )
+            country_ids.update({name: country_id for country_id, name in inserted})
+
+        # Update artist and song of existing countries that changed
+        changed_countries = [
+            {'id': country.id, 'artist': lineup[name][1], 'song': lineup[name][2]}
+            for name, country in countries.items()
+            if (country.artist, country.song) != lineup[name][1:]
+        ]
+        if changed_countries:
+            db.session.execute(db.update(Country), changed_countries)
+
+        # Add countries to the stage, or move them to their new position
+        associations = [
+            {'stage_id': stage.id, 'country_id': country_ids[name], 'order': position}
+            for name, (position, _, _) in lineup.items()
+        ]
+        if associations:
+            stmt = dialect_insert(StageCountry)
+            if stmt is None:
+                for association in associations:
+                    db.session.merge(StageCountry(**association))
+            else:
+                stmt = stmt.values(associations)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=['stage_id', 'country_id'],
+                    set_={'order': stmt.excluded.order}
+                )
+                db.session.execute(stmt)
+        # Countries are shared between stages, so a changed artist or song
+        # moves the versions of every stage that shows them
+        stage_ids = {stage.id}
+        if changed_countries:
+            stage_ids.update(
+                stage_id for (stage_id,) in
+                db.session.query(StageCountry.stage_id).filter(
+                    StageCountry.country_id.in_([country['id'] for country in changed_countries])
+                ).distinct()
+            )
+        bump_versions(*[key for stage_id in stage_ids for key in (stage_key(stage_id), lineup_key(stage_id))])
+        timings['write_ms'] = _elapsed_ms(phase)
+
+        phase = time.perf_counter()
+        db.session.commit()
+        timings['commit_ms'] = _elapsed_ms(phase)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    timings['total_ms'] = _elapsed_ms(started)
+    stats = {
+        'countries_added': sum(1 for association in associations
+                               if association['country_id'] not in existing_associations),
+        'countries_created': len(new_countries),
+        'countries_updated': len(changed_countries),
+        'timings': timings
+    }
+    return stage, stats
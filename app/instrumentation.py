@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+from collections import deque
+from flask import g, jsonify, request, has_request_context
+from sqlalchemy import event
+
+# Set QUERY_STATS=1 to count and time SQL statements per request
+QUERY_STATS_ENABLED = os.getenv('QUERY_STATS', '0') == '1'
+# Number of slowest statements kept per request
+SLOWEST_STATEMENTS = 5
+# Number of recent requests kept for the debug view
+RECENT_REQUESTS = 100
+
+_recent = deque(maxlen=RECENT_REQUESTS)
+_recent_lock = threading.Lock()
+
+
+class QueryStats:
+    """SQL statement count and timing for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.db_time = 0.0
+        self.slowest = []
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.db_time += duration
+        if len(self.slowest) < SLOWEST_STATEMENTS or duration > self.slowest[-1][0]:
+            self.slowest.append((duration, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[SLOWEST_STATEMENTS:]
+
+    def as_dict(self):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.db_time * 1000, 2),
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'slowest': [{'ms': round(duration * 1000, 2), 'sql': statement[:500]}
+                        for duration, statement in self.slowest]
+        }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_started'].pop()
+    if has_request_context():
+        stats = g.get('query_stats')
+        if stats is not None:
+            stats.record(statement, duration)
+
+
+def _start_request():
+    g.query_stats = QueryStats()
+
+
+def _finish_request(response):
+    stats = g.pop('query_stats', None)
+    if stats is None:
+        return response
+    summary = stats.as_dict()
+    response.headers['X-Query-Count'] = str(summary['queries'])
+    response.headers['Server-Timing'] = (
+        f'db;dur={summary["db_ms"]};desc="{summary["queries"]} queries", '
+        f'app;dur={summary["total_ms"]}'
+    )
+    if request.endpoint != 'query_stats':
+        summary.update(method=request.method, path=request.path,
+                       endpoint=request.endpoint, status=response.status_code)
+        with _recent_lock:
+            _recent.append(summary)
+    return response
+
+
+def _query_stats_view():
+    """Debug view listing the query statistics of recent requests, newest first"""
+    with _recent_lock:
+        recent = list(_recent)
+    recent.reverse()
+    return jsonify({'requests': recent})
+
+
+def init_query_stats(app, db):
+    """Attach per-request SQL counting and timing to the app's engines.
+
+    Does nothing unless QUERY_STATS=1, so there is no overhead when disabled.
+    When enabled, responses carry X-Query-Count and Server-Timing headers and
+    /_debug/queries returns the statistics of recent requests as JSON.
+    """
+    if not QUERY_STATS_ENABLED:
+        return
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/_debug/queries', 'query_stats', _query_stats_view)
+    print("✅ QUERY_STATS is enabled - per-request SQL statistics are recorded")
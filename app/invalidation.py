@@ -0,0 +1,170 @@
+import json
+import os
+import select
+import threading
+from .models import db, VersionCounter
+from .versions import NOTIFY_CHANNEL, INVALIDATION_BUS_ENABLED
+from .scoreboard import get_scoreboard, invalidate_scoreboard, loaded_version
+from .scoring import invalidate_points_totals
+from .analytics import invalidate_stage_analytics
+from .live import is_live, publish_rankings
+
+# Seconds between version_counter reads where LISTEN/NOTIFY is unavailable (SQLite)
+POLL_INTERVAL = float(os.getenv('INVALIDATION_POLL_INTERVAL', '0.5'))
+# Longest wait for a notification before checking for shutdown
+LISTEN_TIMEOUT = 5
+MAX_RECONNECT_DELAY = 30
+
+
+class InvalidationListener:
+    """Background thread that hears about version bumps made by any worker.
+
+    On PostgreSQL it LISTENs on NOTIFY_CHANNEL, which bump_versions notifies
+    in the committing transaction. Elsewhere it polls the small
+    version_counter table. Either way, local caches of changed stages are
+    dropped and live ranking subscribers in this process get the new totals,
+    whichever worker took the vote. While connected, the versions it has heard
+    of answer known_version() without a query.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.versions = None
+        self.synced = False
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='invalidation-listener', daemon=True)
+                self.thread.start()
+
+    def close(self):
+        self.synced = False
+        self.stopped.set()
+
+    def _run(self):
+        with self.app.app_context():
+            if db.engine.dialect.name == 'postgresql':
+                self._listen()
+            else:
+                self._poll()
+
+    def _sync(self):
+        """Read every counter and dispatch the ones that moved since the last read.
+
+        The first read only records the versions the caches were built from.
+        """
+        try:
+            current = dict(db.session.query(VersionCounter.key, VersionCounter.value).all())
+        finally:
+            db.session.remove()
+        if self.versions is None:
+            self.versions = current
+        else:
+            self._dispatch({key: value for key, value in current.items() if value > self.versions.get(key, 0)})
+        self.synced = True
+
+    def _poll(self):
+        while True:
+            try:
+                self._sync()
+            except Exception as e:
+                self.synced = False
+                print(f"❌ Error polling version counters: {str(e)}")
+            if self.stopped.wait(POLL_INTERVAL):
+                return
+
+    def _listen(self):
+        delay = 1
+        while not self.stopped.is_set():
+            # A dedicated connection, detached so it never goes back to the pool in LISTEN mode
+            connection = None
+            try:
+                connection = db.engine.raw_connection()
+                connection.detach()
+                driver = connection.driver_connection
+                driver.autocommit = True
+                with driver.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                # Catch up on bumps made while no connection was listening
+                self._sync()
+                delay = 1
+                while not self.stopped.is_set():
+                    if select.select([driver], [], [], LISTEN_TIMEOUT) == ([], [], []):
+                        continue
+                    driver.poll()
+                    changes = {}
+                    while driver.notifies:
+                        changes.update(json.loads(driver.notifies.pop(0).payload))
+                    self._dispatch({key: value for key, value in changes.items()
+                                    if value > self.versions.get(key, 0)})
+            except Exception as e:
+                # Bumps are missed until the next connection catches up on them
+                self.synced = False
+                print(f"❌ Invalidation listener lost its connection, reconnecting in {delay} s: {str(e)}")
+                if self.stopped.wait(delay):
+                    return
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+    def _dispatch(self, changes):
+        if not changes:
+            return
+        self.versions.update(changes)
+        for key, version in changes.items():
+            if key.startswith('stage:'):
+                try:
+                    stage_changed(int(key.split(':', 1)[1]), version)
+                except Exception as e:
+                    print(f"❌ Error invalidating {key}: {str(e)}")
+                finally:
+                    db.session.remove()
+
+
+def stage_changed(stage_id, version):
+    """Drop this process's caches for a stage that reached version and refresh live subscribers"""
+    loaded = loaded_version(stage_id)
+    if loaded is not None and loaded >= version:
+        # This process made the change itself and already applied it
+        return
+    invalidate_scoreboard(stage_id)
+    invalidate_points_totals(stage_id)
+    invalidate_stage_analytics(stage_id)
+    if is_live(stage_id):
+        board_version, totals = get_scoreboard(stage_id, version).snapshot()
+        publish_rankings(stage_id, board_version, totals)
+
+
+def known_version(key):
+    """Value of a version counter as last heard by this process's listener.
+
+    Returns None while the listener is not connected and caught up, in which
+    case the caller reads the counter from the database instead. The value
+    trails a commit by the notification latency (POLL_INTERVAL on SQLite).
+    """
+    from flask import current_app
+    listener = current_app.extensions.get('invalidation_listener')
+    if listener is None or not listener.synced:
+        return None
+    return listener.versions.get(key, 0)
+
+
+def _start_listener():
+    from flask import current_app
+    current_app.extensions['invalidation_listener'].start()
+
+
+def init_invalidation(app):
+    """Start the invalidation listener with the first request each process serves"""
+    if not INVALIDATION_BUS_ENABLED:
+        return
+    app.extensions['invalidation_listener'] = InvalidationListener(app)
+    app.before_request(_start_listener)
@@ -0,0 +1,137 @@
+import threading
+from collections import namedtuple
+from .models import db, Stage, Country, User, StageCountry, CurrentGrade
+from .country_flags import get_flag_emoji
+from .versions import version_sum
+
+# stages: [(stage_id, name, lineup size)] in id order; ballots: {user_id: {stage_id: votes}}
+Leaderboard = namedtuple('Leaderboard', ['version', 'stages', 'countries', 'voters', 'summaries', 'ballots'])
+# stages: {stage_id: (total, votes)} for every stage the country is in
+CountryStanding = namedtuple('CountryStanding', ['id', 'name', 'flag', 'stages', 'total', 'votes', 'average'])
+# stages: {stage_id: votes} for every stage the user graded a country in
+VoterParticipation = namedtuple('VoterParticipation', ['id', 'username', 'stages', 'votes', 'participated'])
+# Figures shown on the index page stage cards; leader is a CountryStanding or None
+StageSummary = namedtuple('StageSummary', ['id', 'name', 'countries', 'voters', 'votes', 'leader', 'leader_total'])
+
+_leaderboard = [None]
+_leaderboard_lock = threading.Lock()
+
+
+def global_version():
+    """Version of everything the leaderboard shows: the sum of all stage versions.
+
+    Every vote, import and order change bumps its stage's counter, so the sum
+    moves with any of them, without a single global counter row that every
+    vote in every stage would have to update.
+    """
+    return version_sum('stage:')
+
+
+def leaderboard_query():
+    """One statement returning (kind, stage_id, id, name, total, votes, order) rows.
+
+    Three grouped selects over the latest grades are combined with UNION ALL:
+    'country' rows per stage and lineup country (countries without grades
+    included, with their performance order), 'voter' rows per stage and user,
+    and one 'stage' row per stage.
+    """
+    country_rows = (
+        db.select(
+            db.literal('country').label('kind'),
+            StageCountry.stage_id,
+            StageCountry.country_id.label('id'),
+            Country.display_name.label('name'),
+            db.func.coalesce(db.func.sum(CurrentGrade.value), 0).label('total'),
+            db.func.count(CurrentGrade.value).label('votes'),
+            StageCountry.order
+        )
+        .join(Country, Country.id == StageCountry.country_id)
+        .outerjoin(CurrentGrade, db.and_(
+            CurrentGrade.stage_id == StageCountry.stage_id,
+            CurrentGrade.country_id == StageCountry.country_id
+        ))
+        .group_by(StageCountry.stage_id, StageCountry.country_id, Country.display_name, StageCountry.order)
+    )
+    voter_rows = (
+        db.select(
+            db.literal('voter'),
+            CurrentGrade.stage_id,
+            CurrentGrade.user_id,
+            User.username,
+            db.func.sum(CurrentGrade.value),
+            db.func.count(CurrentGrade.value),
+            db.null()
+        )
+        .join(User, User.id == CurrentGrade.user_id)
+        # Only grades for countries still in the lineup count, as in the rankings
+        .join(StageCountry, db.and_(
+            StageCountry.stage_id == CurrentGrade.stage_id,
+            StageCountry.country_id == CurrentGrade.country_id
+        ))
+        .group_by(CurrentGrade.stage_id, CurrentGrade.user_id, User.username)
+    )
+    stage_rows = db.select(
+        db.literal('stage'), Stage.id, Stage.id, Stage.display_name, db.literal(0), db.literal(0), db.null()
+    )
+    return db.union_all(country_rows, voter_rows, stage_rows)
+
+
+def build_leaderboard(version=None):
+    """Run leaderboard_query and assemble country standings and voter participation"""
+    stage_names = {}
+    lineup_sizes = {}
+    countries = {}
+    voters = {}
+    # Per stage: (total, order, country_id) of the leading country so far
+    leaders = {}
+    for kind, stage_id, item_id, name, total, votes, order in db.session.execute(leaderboard_query()):
+        if kind == 'stage':
+            stage_names[stage_id] = name
+        elif kind == 'country':
+            lineup_sizes[stage_id] = lineup_sizes.get(stage_id, 0) + 1
+            countries.setdefault(item_id, (name, {}))[1][stage_id] = (int(total), int(votes))
+            # Same tie-break as the stage rankings: earlier performance order wins
+            candidate = (-int(total), order if order is not None else float('inf'), item_id)
+            if total and (stage_id not in leaders or candidate < leaders[stage_id]):
+                leaders[stage_id] = candidate
+        else:
+            voters.setdefault(item_id, (name, {}))[1][stage_id] = int(votes)
+
+    standings = []
+    for country_id, (name, stages) in countries.items():
+        total = sum(stage_total for stage_total, _ in stages.values())
+        votes = sum(stage_votes for _, stage_votes in stages.values())
+        standings.append(CountryStanding(country_id, name, get_flag_emoji(name), stages, total, votes,
+                                         round(total / votes, 2) if votes else 0))
+    standings.sort(key=lambda standing: (-standing.total, -standing.average, standing.name))
+
+    participation = [VoterParticipation(user_id, username, stages, sum(stages.values()), len(stages))
+                     for user_id, (username, stages) in voters.items()]
+    participation.sort(key=lambda voter: (-voter.participated, -voter.votes, voter.username))
+
+    stages = [(stage_id, stage_names[stage_id], lineup_sizes.get(stage_id, 0))
+              for stage_id in sorted(stage_names)]
+    standings_by_id = {standing.id: standing for standing in standings}
+    summaries = []
+    for stage_id, name, size in stages:
+        stage_votes = [voter.stages[stage_id] for voter in participation if stage_id in voter.stages]
+        leader = leaders.get(stage_id)
+        summaries.append(StageSummary(stage_id, name, size, len(stage_votes), sum(stage_votes),
+                                      standings_by_id[leader[2]] if leader else None,
+                                      -leader[0] if leader else 0))
+    ballots = {voter.id: voter.stages for voter in participation}
+    return Leaderboard(version, stages, standings, participation, summaries, ballots)
+
+
+def get_leaderboard(version=None):
+    """The leaderboard at a global version, rebuilt only when that version has moved on"""
+    if version is None:
+        version = global_version()
+    with _leaderboard_lock:
+        cached = _leaderboard[0]
+    if cached is not None and cached.version == version:
+        return cached
+    leaderboard = build_leaderboard(version)
+    with _leaderboard_lock:
+        _leaderboard[0] = leaderboard
+    return leaderboard
@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+from collections import deque
+from .scoreboard import get_scoreboard
+
+# How stage pages follow the rankings: 'stream' holds an SSE connection open per
+# page, 'poll' revalidates the rankings JSON every POLL_SECONDS. An open stream
+# occupies a worker thread under gthread, so gunicorn.conf.py picks 'poll' there
+LIVE_RANKINGS = os.getenv('LIVE_RANKINGS', 'stream')
+POLL_SECONDS = float(os.getenv('LIVE_POLL_SECONDS', '3'))
+# Seconds between keep-alive comments on an idle stream
+KEEPALIVE_SECONDS = int(os.getenv('SSE_KEEPALIVE_SECONDS', '15'))
+# Number of recent diffs kept per stage so slow subscribers can catch up
+HISTORY_SIZE = 64
+
+
+class StageBroadcaster:
+    """Fan-out of ranking changes for one stage to all of its SSE subscribers.
+
+    Publishers hand in full scoreboard snapshots; the broadcaster keeps only
+    the diff against the previous snapshot. Subscribers block on a shared
+    condition, so an idle subscriber costs a sleeping thread (a greenlet under
+    an async worker class) and nothing else.
+    """
+
+    def __init__(self, version, totals):
+        self.condition = threading.Condition()
+        self.version = version
+        self.totals = dict(totals)
+        self.diffs = deque(maxlen=HISTORY_SIZE)
+        self.evicted_version = version
+
+    def publish(self, version, totals):
+        """Record a new snapshot and wake subscribers if any total changed"""
+        totals = dict(totals)
+        with self.condition:
+            if version <= self.version:
+                return
+            changed = [[country_id, total] for country_id, total in totals.items()
+                       if self.totals.get(country_id) != total]
+            changed += [[country_id, 0] for country_id in self.totals
+                        if country_id not in totals]
+            self.version = version
+            self.totals = totals
+            if changed:
+                if len(self.diffs) == self.diffs.maxlen:
+                    self.evicted_version = self.diffs[0][0]
+                self.diffs.append((version, changed))
+                self.condition.notify_all()
+
+    def snapshot(self):
+        with self.condition:
+            return self.version, list(self.totals.items())
+
+    def wait(self, last_version, timeout):
+        """Block until there are diffs newer than last_version.
+
+        Returns a list of (version, changed) diffs, an empty list on timeout,
+        or None if the subscriber fell too far behind and needs a snapshot.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: bool(self.diffs) and self.diffs[-1][0] > last_version,
+                timeout
+            )
+            if self.evicted_version > last_version:
+                return None
+            return [diff for diff in self.diffs if diff[0] > last_version]
+
+
+_broadcasters = {}
+_registry_lock = threading.Lock()
+
+
+def get_broadcaster(stage_id, version, totals):
+    """Return the shared broadcaster for a stage, creating it from a snapshot if needed"""
+    with _registry_lock:
+        broadcaster = _broadcasters.get(stage_id)
+        if broadcaster is None:
+            broadcaster = StageBroadcaster(version, totals)
+            _broadcasters[stage_id] = broadcaster
+        return broadcaster
+
+
+def is_live(stage_id):
+    """Whether anyone has subscribed to live rankings for a stage in this process"""
+    return stage_id in _broadcasters
+
+
+def publish_rankings(stage_id, version, totals):
+    """Push a scoreboard snapshot to the stage's subscribers, if anyone is listening"""
+    broadcaster = _broadcasters.get(stage_id)
+    if broadcaster is not None:
+        broadcaster.publish(version, totals)
+
+
+def publish_stage(stage_id):
+    """Push the stage's scoreboard to live ranking subscribers, if there are any"""
+    if is_live(stage_id):
+        version, totals = get_scoreboard(stage_id).snapshot()
+        publish_rankings(stage_id, version, totals)
+
+
+def _event(name, version, totals):
+    data = json.dumps({'v': version, 't': totals}, separators=(',', ':'))
+    return f"id: {version}\nevent: {name}\ndata: {data}\n\n"
+
+
+def ranking_stream(broadcaster):
+    """Generate SSE messages: a full snapshot first, then compact ranking diffs.
+
+    Each message carries ``{"v": version, "t": [[country_id, total], ...]}``;
+    a total of 0 in a diff means the country dropped out of the rankings.
+    """
+    version, totals = broadcaster.snapshot()
+    yield "retry: 5000\n\n"
+    yield _event('snapshot', version, [[country_id, total] for country_id, total in totals])
+    while True:
+        diffs = broadcaster.wait(version, KEEPALIVE_SECONDS)
+        if diffs is None:
+            version, totals = broadcaster.snapshot()
+            yield _event('snapshot', version, [[country_id, total] for country_id, total in totals])
+        elif not diffs:
+            yield ": keep-alive\n\n"
+        else:
+            for version, changed in diffs:
+                yield _event('diff', version, changed)
@@ -0,0 +1,350 @@
+import glob
+import json
+import os
+import threading
+import time
+from flask import Response, g, request
+from .fragments import fragment_cache
+
+# Set METRICS_DIR to a directory shared by all worker processes to aggregate
+# metrics across processes; each process writes its own snapshot file there
+METRICS_DIR = os.getenv('METRICS_DIR')
+# Minimum seconds between snapshot file writes per process
+SNAPSHOT_INTERVAL = 1.0
+# Snapshot file holding the summed counters of worker processes that have exited
+RETIRED_SNAPSHOT = 'metrics-retired.json'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _new_histogram(buckets):
+    # One count per bucket plus +Inf, then sum and count
+    return [0] * (len(buckets) + 1) + [0.0, 0]
+
+
+def _observe(histogram, buckets, value):
+    index = len(buckets)
+    for position, bound in enumerate(buckets):
+        if value <= bound:
+            index = position
+            break
+    histogram[index] += 1
+    histogram[-2] += value
+    histogram[-1] += 1
+
+
+class _Shard:
+    """Metrics written by a single thread; only that thread ever updates it"""
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.latency = {}
+        self.requests = {}
+        self.in_flight = {}
+        self.pool_wait = _new_histogram(POOL_WAIT_BUCKETS)
+
+
+_shards = []
+_shards_lock = threading.Lock()
+_local = threading.local()
+_last_snapshot = [0.0]
+# Totals of threads that have exited (servers may start a thread per request)
+_retired = _Shard()
+
+
+def _shard():
+    """Return the calling thread's shard, registering it on first use.
+
+    Each thread only ever writes to its own shard, so recording a metric
+    takes no lock; readers sum all shards when rendering.
+    """
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _Shard()
+        _local.shard = shard
+        with _shards_lock:
+            _shards.append(shard)
+            if len(_shards) > 256:
+                _retire_dead_shards()
+    return shard
+
+
+def _merge_histogram(target, source):
+    for index, value in enumerate(source):
+        target[index] += value
+
+
+def _merge_shard(target, shard):
+    """Add a shard's metrics into the target shard"""
+    for endpoint, histogram in list(shard.latency.items()):
+        _merge_histogram(target.latency.setdefault(endpoint, _new_histogram(LATENCY_BUCKETS)), histogram)
+    for key, count in list(shard.requests.items()):
+        target.requests[key] = target.requests.get(key, 0) + count
+    for endpoint, count in list(shard.in_flight.items()):
+        target.in_flight[endpoint] = target.in_flight.get(endpoint, 0) + count
+    _merge_histogram(target.pool_wait, shard.pool_wait)
+
+
+def _retire_dead_shards():
+    """Fold the shards of exited threads into _retired. Call with _shards_lock held"""
+    for shard in [shard for shard in _shards if not shard.thread.is_alive()]:
+        _merge_shard(_retired, shard)
+        _shards.remove(shard)
+
+
+def process_snapshot():
+    """Sum every thread's shard into a JSON-serialisable snapshot for this process"""
+    total = _Shard()
+    with _shards_lock:
+        _retire_dead_shards()
+        _merge_shard(total, _retired)
+        shards = list(_shards)
+    for shard in shards:
+        _merge_shard(total, shard)
+    return {
+        'pid': os.getpid(),
+        'latency': total.latency,
+        'requests': total.requests,
+        'in_flight': total.in_flight,
+        'pool_wait': total.pool_wait,
+        'fragment_cache': fragment_cache.stats()
+    }
+
+
+def _write_snapshot(force=False):
+    """Persist this process's snapshot to METRICS_DIR, at most once per SNAPSHOT_INTERVAL"""
+    if not METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _last_snapshot[0] < SNAPSHOT_INTERVAL:
+        return
+    _last_snapshot[0] = now
+    path = os.path.join(METRICS_DIR, f'metrics-{os.getpid()}.json')
+    temp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w') as snapshot_file:
+        json.dump(process_snapshot(), snapshot_file)
+    os.replace(temp_path, path)
+
+
+def flush_snapshot():
+    """Write this process's snapshot now, e.g. right before the process exits"""
+    _write_snapshot(force=True)
+
+
+def clear_snapshots():
+    """Remove every snapshot file, so a new server run starts counting from zero"""
+    if not METRICS_DIR:
+        return
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def retire_snapshot(pid):
+    """Fold the snapshot of an exited process into RETIRED_SNAPSHOT and remove its file.
+
+    Counters and histograms keep counting; gauges (in-flight requests, cache
+    entries and size) are dropped. Call from one process only (the gunicorn
+    master), so the retired file has a single writer.
+    """
+    if not METRICS_DIR:
+        return
+    path = os.path.join(METRICS_DIR, f'metrics-{pid}.json')
+    retired_path = os.path.join(METRICS_DIR, RETIRED_SNAPSHOT)
+    try:
+        with open(path) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except (OSError, ValueError):
+        return
+    try:
+        with open(retired_path) as retired_file:
+            retired = json.load(retired_file)
+    except (OSError, ValueError):
+        retired = {'pid': None, 'latency': {}, 'requests': {}, 'in_flight': {},
+                   'pool_wait': _new_histogram(POOL_WAIT_BUCKETS), 'fragment_cache': {}}
+    for endpoint, histogram in snapshot['latency'].items():
+        _merge_histogram(retired['latency'].setdefault(endpoint, _new_histogram(LATENCY_BUCKETS)), histogram)
+    for key, count in snapshot['requests'].items():
+        retired['requests'][key] = retired['requests'].get(key, 0) + count
+    _merge_histogram(retired['pool_wait'], snapshot['pool_wait'])
+    for key in ('hits', 'misses', 'evictions'):
+        value = snapshot.get('fragment_cache', {}).get(key, 0)
+        retired['fragment_cache'][key] = retired['fragment_cache'].get(key, 0) + value
+    temp_path = f'{retired_path}.tmp'
+    with open(temp_path, 'w') as retired_file:
+        json.dump(retired, retired_file)
+    os.replace(temp_path, retired_path)
+    os.remove(path)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _collect():
+    """Combine the snapshots of all processes (or just this one without METRICS_DIR).
+
+    Includes RETIRED_SNAPSHOT, the totals of processes that have exited.
+    """
+    if not METRICS_DIR:
+        return [process_snapshot()]
+    _write_snapshot(force=True)
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*.json')):
+        try:
+            with open(path) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (OSError, ValueError):
+            continue
+        if snapshot['pid'] is not None and not _process_alive(snapshot['pid']):
+            # Counters of exited workers still count; their in-flight gauge does not
+            snapshot['in_flight'] = {}
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def _histogram_lines(name, labels, histogram, buckets):
+    label_prefix = ','.join(f'{key}="{value}"' for key, value in labels)
+    separator = ',' if label_prefix else ''
+    lines = []
+    cumulative = 0
+    for bound, count in zip(list(buckets) + ['+Inf'], histogram[:-2]):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{label_prefix}{separator}le="{bound}"}} {cumulative}')
+    suffix = f'{{{label_prefix}}}' if label_prefix else ''
+    lines.append(f'{name}_sum{suffix} {histogram[-2]}')
+    lines.append(f'{name}_count{suffix} {histogram[-1]}')
+    return lines
+
+
+def render_metrics():
+    """Render all metrics in the Prometheus text exposition format"""
+    latency = {}
+    requests = {}
+    in_flight = {}
+    pool_wait = _new_histogram(POOL_WAIT_BUCKETS)
+    fragments = {}
+    for snapshot in _collect():
+        for endpoint, histogram in snapshot['latency'].items():
+            _merge_histogram(latency.setdefault(endpoint, _new_histogram(LATENCY_BUCKETS)), histogram)
+        for key, count in snapshot['requests'].items():
+            requests[key] = requests.get(key, 0) + count
+        for endpoint, count in snapshot['in_flight'].items():
+            in_flight[endpoint] = in_flight.get(endpoint, 0) + count
+        _merge_histogram(pool_wait, snapshot['pool_wait'])
+        for key, value in snapshot.get('fragment_cache', {}).items():
+            fragments[key] = fragments.get(key, 0) + value
+
+    lines = [
+        '# HELP eurovision_request_duration_seconds Request latency per endpoint.',
+        '# TYPE eurovision_request_duration_seconds histogram',
+    ]
+    for endpoint in sorted(latency):
+        lines += _histogram_lines('eurovision_request_duration_seconds', [('endpoint', endpoint)],
+                                  latency[endpoint], LATENCY_BUCKETS)
+    lines += [
+        '# HELP eurovision_requests_total Requests per endpoint and status code.',
+        '# TYPE eurovision_requests_total counter',
+    ]
+    for key in sorted(requests):
+        endpoint, status = key.split('|')
+        lines.append(f'eurovision_requests_total{{endpoint="{endpoint}",status="{status}"}} {requests[key]}')
+    lines += [
+        '# HELP eurovision_requests_in_flight Requests currently being handled per endpoint.',
+        '# TYPE eurovision_requests_in_flight gauge',
+    ]
+    for endpoint in sorted(in_flight):
+        lines.append(f'eurovision_requests_in_flight{{endpoint="{endpoint}"}} {in_flight[endpoint]}')
+    lines += [
+        '# HELP eurovision_db_pool_checkout_seconds Time spent waiting for a database connection from the pool.',
+        '# TYPE eurovision_db_pool_checkout_seconds histogram',
+    ]
+    lines += _histogram_lines('eurovision_db_pool_checkout_seconds', [], pool_wait, POOL_WAIT_BUCKETS)
+    lines += [
+        '# HELP eurovision_fragment_cache_requests_total Rendered-fragment cache lookups by result.',
+        '# TYPE eurovision_fragment_cache_requests_total counter',
+        f'eurovision_fragment_cache_requests_total{{result="hit"}} {fragments.get("hits", 0)}',
+        f'eurovision_fragment_cache_requests_total{{result="miss"}} {fragments.get("misses", 0)}',
+        '# HELP eurovision_fragment_cache_evictions_total Fragments evicted to stay under the size cap.',
+        '# TYPE eurovision_fragment_cache_evictions_total counter',
+        f'eurovision_fragment_cache_evictions_total {fragments.get("evictions", 0)}',
+        '# HELP eurovision_fragment_cache_entries Fragments currently cached.',
+        '# TYPE eurovision_fragment_cache_entries gauge',
+        f'eurovision_fragment_cache_entries {fragments.get("entries", 0)}',
+        '# HELP eurovision_fragment_cache_size_chars Characters of rendered HTML currently cached.',
+        '# TYPE eurovision_fragment_cache_size_chars gauge',
+        f'eurovision_fragment_cache_size_chars {fragments.get("size", 0)}',
+    ]
+    return '\n'.join(lines) + '\n'
+
+
+def _start_request():
+    endpoint = request.endpoint or 'unknown'
+    g.metrics_endpoint = endpoint
+    g.metrics_started = time.perf_counter()
+    shard = _shard()
+    shard.in_flight[endpoint] = shard.in_flight.get(endpoint, 0) + 1
+
+
+def _record_status(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _finish_request(exception):
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint is None:
+        return
+    duration = time.perf_counter() - g.pop('metrics_started')
+    status = g.pop('metrics_status', 500 if exception else 200)
+    shard = _shard()
+    shard.in_flight[endpoint] -= 1
+    histogram = shard.latency.get(endpoint)
+    if histogram is None:
+        histogram = shard.latency[endpoint] = _new_histogram(LATENCY_BUCKETS)
+    _observe(histogram, LATENCY_BUCKETS, duration)
+    key = f'{endpoint}|{status}'
+    shard.requests[key] = shard.requests.get(key, 0) + 1
+    _write_snapshot()
+
+
+def _instrument_pool(pool):
+    """Time every connection checkout from a SQLAlchemy pool"""
+    checkout = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return checkout()
+        finally:
+            _observe(_shard().pool_wait, POOL_WAIT_BUCKETS, time.perf_counter() - started)
+
+    pool.connect = timed_connect
+
+
+def _metrics_view():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app, db):
+    """Record request latency, in-flight requests and pool checkout time, served at /metrics"""
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            _instrument_pool(engine.pool)
+
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', _metrics_view)
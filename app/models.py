@@ -1,7 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from .replica import RoutingSession
 
-db = SQLAlchemy()
+# The routing session sends reads of replica-routed requests to DATABASE_REPLICA_URL
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class StageCountry(db.Model):
     __tablename__ = 'stage_country'
@@ -13,6 +15,11 @@ class StageCountry(db.Model):
     stage = db.relationship("Stage", back_populates="country_associations")
     country = db.relationship("Country", back_populates="stage_associations")
 
+    __table_args__ = (
+        # Stage lineups are always read sorted by performance order
+        db.Index('ix_stage_country_stage_order', 'stage_id', 'order'),
+    )
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
@@ -24,6 +31,8 @@ class User(db.Model):
 class Stage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     display_name = db.Column(db.String(128), nullable=False)
+    # Ranking mode shown by default: 'grades' (sum of grades, the default) or 'points'
+    scoring = db.Column(db.String(16), nullable=True)
     country_associations = db.relationship('StageCountry', back_populates='stage', cascade="all, delete-orphan")
     countries = db.relationship('Country', secondary='stage_country', viewonly=True)
     grades = db.relationship('Grade', backref='stage', lazy=True)
@@ -53,3 +62,57 @@ class Grade(db.Model):
 
     def __repr__(self):
         return f'<Grade {self.value} by User {self.user_id} for Country {self.country_id} on Stage {self.stage_id}>'
+
+# History lookups filter on (user, stage[, country]) and order by timestamp;
+# the latest-grade window partitions by (stage, country, user) newest first
+db.Index('ix_grade_user_stage_country_ts', Grade.user_id, Grade.stage_id, Grade.country_id, Grade.timestamp)
+db.Index('ix_grade_stage_country_user_ts', Grade.stage_id, Grade.country_id, Grade.user_id, Grade.timestamp.desc())
+
+class GradeArchive(db.Model):
+    # Superseded Grade rows moved out of the hot table by `flask compact-grades`.
+    # Rows keep their Grade id; the latest grade per key always stays in Grade.
+    __tablename__ = 'grade_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    value = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    stage_id = db.Column(db.Integer, db.ForeignKey('stage.id'), nullable=False)
+    country_id = db.Column(db.Integer, db.ForeignKey('country.id'), nullable=False)
+    timestamp = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_grade_archive_user_stage_country_ts', 'user_id', 'stage_id', 'country_id', 'timestamp'),
+    )
+
+    def __repr__(self):
+        return f'<GradeArchive {self.value} by User {self.user_id} for Country {self.country_id} on Stage {self.stage_id}>'
+
+class CurrentGrade(db.Model):
+    # Read model holding only the latest grade per (user, stage, country).
+    # Grade keeps the full history; this table is upserted alongside it.
+    __tablename__ = 'current_grade'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    stage_id = db.Column(db.Integer, db.ForeignKey('stage.id'), primary_key=True)
+    country_id = db.Column(db.Integer, db.ForeignKey('country.id'), primary_key=True)
+    value = db.Column(db.Integer, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    country = db.relationship('Country')
+
+    __table_args__ = (
+        # Rankings aggregate per (stage, country); the primary key covers per-user lookups
+        db.Index('ix_current_grade_stage_country', 'stage_id', 'country_id', 'value'),
+    )
+
+    def __repr__(self):
+        return f'<CurrentGrade {self.value} by User {self.user_id} for Country {self.country_id} on Stage {self.stage_id}>'
+
+class VersionCounter(db.Model):
+    # Monotonic counters shared by all worker processes, bumped in the same
+    # transaction as the change they describe ('stage:<id>', 'lineup:<id>', 'users')
+    __tablename__ = 'version_counter'
+    key = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<VersionCounter {self.key}={self.value}>'
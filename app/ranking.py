@@ -0,0 +1,120 @@
+from collections import namedtuple
+from .models import db, Country, CurrentGrade, StageCountry
+from .grades import latest_grades_subquery
+
+# Per-user summary for a stage: number of countries graded and the favourite's name
+VoterSummary = namedtuple('VoterSummary', ['votes', 'favorite'])
+
+
+def sort_totals(rows):
+    """Sort (country_id, total, order) rows by total, then performance order, dropping empty totals"""
+    rows = [row for row in rows if row[1] and row[1] > 0]
+    rows.sort(key=lambda row: (-row[1], row[2] if row[2] is not None else float('inf'), row[0]))
+    return [(country_id, int(total)) for country_id, total, _ in rows]
+
+
+def stage_aggregates_query(stage_id, from_history=False):
+    """Query for the total grade and voter count of every country in a stage lineup.
+
+    Yields (country_id, total, voters, order) rows, including countries nobody
+    has graded yet. By default the current_grade read model is aggregated;
+    with from_history=True a ROW_NUMBER window over the Grade history picks
+    each user's latest grade instead, so the result does not depend on the
+    read model. Either way this is a single query.
+    """
+    if from_history:
+        source = latest_grades_subquery(stage_id)
+        value, stage_col, country_col = source.c.value, source.c.stage_id, source.c.country_id
+    else:
+        value, stage_col, country_col = CurrentGrade.value, CurrentGrade.stage_id, CurrentGrade.country_id
+
+    return (
+        db.session.query(
+            StageCountry.country_id,
+            db.func.coalesce(db.func.sum(value), 0),
+            db.func.count(value),
+            StageCountry.order
+        )
+        .outerjoin(source if from_history else CurrentGrade, db.and_(
+            stage_col == StageCountry.stage_id,
+            country_col == StageCountry.country_id
+        ))
+        .filter(StageCountry.stage_id == stage_id)
+        .group_by(StageCountry.country_id, StageCountry.order)
+    )
+
+
+def stage_aggregates(stage_id, from_history=False):
+    """Run stage_aggregates_query and return a list of (country_id, total, voters, order)"""
+    rows = stage_aggregates_query(stage_id, from_history).all()
+    return [(country_id, int(total), int(voters), order) for country_id, total, voters, order in rows]
+
+
+def stage_totals(stage_id):
+    """Total grade per country in a stage as a list of (country_id, total), highest first.
+
+    Runs a single grouped query over the current grades of every user,
+    restricted to the countries in the stage lineup.
+    """
+    return sort_totals([(country_id, total, order)
+                        for country_id, total, _, order in stage_aggregates(stage_id)])
+
+
+def ranking_items(totals, countries):
+    """Turn (country_id, total) pairs into the (country, total) pairs used by stage.html"""
+    countries_by_id = {country.id: country for country in countries}
+    return [(countries_by_id[country_id], total)
+            for country_id, total in totals
+            if country_id in countries_by_id]
+
+
+def rankings_data(totals):
+    """Turn (country_id, total) pairs into the JSON rankings list"""
+    return [{'country_id': country_id, 'total_grade': total}
+            for country_id, total in totals]
+
+
+def voter_summaries_query(stage_id):
+    """Select (user_id, votes, favourite name) for every user who graded a stage.
+
+    The favourite is the highest grade; ties go to the country that performs
+    first, then to the lowest country id.
+    """
+    favorite_rank = db.func.row_number().over(
+        partition_by=CurrentGrade.user_id,
+        order_by=(
+            CurrentGrade.value.desc(),
+            db.func.coalesce(StageCountry.order, 2147483647),
+            CurrentGrade.country_id
+        )
+    ).label('favorite_rank')
+    votes = db.func.count().over(partition_by=CurrentGrade.user_id).label('votes')
+    ranked = (
+        db.session.query(
+            CurrentGrade.user_id,
+            Country.display_name,
+            votes,
+            favorite_rank
+        )
+        .join(Country, Country.id == CurrentGrade.country_id)
+        .outerjoin(StageCountry, db.and_(
+            StageCountry.stage_id == CurrentGrade.stage_id,
+            StageCountry.country_id == CurrentGrade.country_id
+        ))
+        .filter(CurrentGrade.stage_id == stage_id)
+        .subquery()
+    )
+    return (
+        db.select(ranked.c.user_id, ranked.c.votes, ranked.c.display_name)
+        .where(ranked.c.favorite_rank == 1)
+    )
+
+
+def voter_summaries(stage_id):
+    """Votes cast and favourite country of every user who graded a stage.
+
+    Returns {user_id: VoterSummary(votes, favorite)} from a single query over
+    the current grades.
+    """
+    rows = db.session.execute(voter_summaries_query(stage_id)).all()
+    return {user_id: VoterSummary(votes, favorite) for user_id, votes, favorite in rows}
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from collections import deque
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+# Optional read replica; without it every query goes to DATABASE_URL
+REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+REPLICA_BIND = 'replica'
+# Reads go back to the primary while the replica is more than this many seconds behind
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', '5'))
+# Seconds between replica lag checks per worker process
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '1'))
+# A user's reads stay on the primary for this many seconds after their own writes
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', '10'))
+
+# Endpoints that only read and may be served by the replica (GET and HEAD only)
+READ_ENDPOINTS = {
+    'index', 'stage', 'stage_rankings', 'user_votes', 'stage_analytics', 'leaderboard',
+    'api_stages', 'api_lineup', 'api_rankings', 'api_ballots', 'api_ballot',
+    'api_leaderboard', 'api_leaderboard_voters',
+}
+
+VERSION_SUM = "SELECT COALESCE(SUM(value), 0) FROM version_counter"
+
+
+class RoutingSession(Session):
+    """Session that reads from the replica during requests routed there.
+
+    Flushes and INSERT/UPDATE/DELETE statements always go to the primary, so
+    a read route that does write by accident still writes to the right place.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and has_request_context() and g.get('read_replica')
+                and not self._flushing and not isinstance(clause, UpdateBase)):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaMonitor:
+    """Tracks how far the replica is behind the primary, in seconds.
+
+    Each check records the sum of the primary's version counters. Every write
+    bumps a counter, so once the replica's sum reaches a recorded value, it
+    has replayed everything the primary had at that time. The replica's lag
+    is at most the age of the newest such sample.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.samples = deque()
+        self.lag = 0.0
+        self.healthy = True
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def usable(self):
+        """Whether reads may go to the replica; checks the lag at most every REPLICA_CHECK_INTERVAL"""
+        now = time.monotonic()
+        if now - self.checked_at >= REPLICA_CHECK_INTERVAL and self.lock.acquire(blocking=False):
+            try:
+                if now - self.checked_at >= REPLICA_CHECK_INTERVAL:
+                    self.checked_at = now
+                    self.check(now)
+            finally:
+                self.lock.release()
+        return self.healthy
+
+    def check(self, now):
+        try:
+            with self.db.engines[None].connect() as connection:
+                primary = connection.exec_driver_sql(VERSION_SUM).scalar()
+            with self.db.engines[REPLICA_BIND].connect() as connection:
+                replica = connection.exec_driver_sql(VERSION_SUM).scalar()
+        except Exception as e:
+            self._set_healthy(False, f"❌ Read replica check failed, reading from the primary: {str(e)}")
+            return
+
+        self.samples.append((now, primary))
+        # Samples older than twice the allowed lag can no longer change the verdict
+        while len(self.samples) > 1 and now - self.samples[1][0] > 2 * REPLICA_MAX_LAG:
+            self.samples.popleft()
+        caught_up = [sampled_at for sampled_at, value in self.samples if value <= replica]
+        self.lag = now - max(caught_up) if caught_up else now - self.samples[0][0]
+        if self.lag > REPLICA_MAX_LAG:
+            self._set_healthy(False, f"⚠️ Read replica is {self.lag:.1f} s behind, reading from the primary")
+        else:
+            self._set_healthy(True, "✅ Read replica caught up, reading from the replica again")
+
+    def _set_healthy(self, healthy, message):
+        if healthy != self.healthy:
+            print(message)
+        self.healthy = healthy
+
+
+def _route_request():
+    if request.method not in ('GET', 'HEAD') or request.endpoint not in READ_ENDPOINTS:
+        return
+    # Read-your-writes: users who just wrote read from the primary until the replica has caught up
+    if time.time() - session.get('_wrote_at', 0) < READ_YOUR_WRITES_SECONDS:
+        g.read_replica = False
+    else:
+        g.read_replica = current_app.extensions['replica_monitor'].usable()
+
+
+def _remember_write(response):
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        session['_wrote_at'] = time.time()
+    if 'read_replica' in g:
+        response.headers['X-Read-Source'] = 'replica' if g.read_replica else 'primary'
+    return response
+
+
+def init_read_replica(app, db):
+    """Route read-only endpoints to DATABASE_REPLICA_URL when it is set.
+
+    The replica engine is configured as the 'replica' bind in create_app.
+    """
+    if not REPLICA_URL:
+        return
+    app.extensions['replica_monitor'] = ReplicaMonitor(db)
+    app.before_request(_route_request)
+    app.after_request(_remember_write)
+    print(f"✅ Using read replica: {REPLICA_URL.split('@')[1] if '@' in REPLICA_URL else REPLICA_URL}")
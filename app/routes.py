@@ -1,11 +1,41 @@
-from flask import render_template, request, redirect, session, url_for, flash, jsonify, json
-from .models import db, User, Stage, Country, Grade, StageCountry
+from flask import (render_template, request, redirect, session, url_for, flash, jsonify, Response,
+                   make_response, current_app)
+from .models import db, User, Stage, Country, CurrentGrade, StageCountry
+from .grades import record_grade, record_grades
+from .importer import import_lineup, read_lineup_csv
+from .staging import StagedImport, load_staged, discard_staged
+from .writebehind import BufferFull, get_vote_buffer, remember_pending, has_pending, pending_grades
+from .versions import (USERS_KEY, stage_key, lineup_key, bump_versions, get_versions,
+                       make_etag, not_modified, with_etag)
+from .ranking import ranking_items, rankings_data, voter_summaries
+from .scoreboard import get_scoreboard, apply_votes, invalidate_scoreboard
+from .live import LIVE_RANKINGS, POLL_SECONDS, get_broadcaster, publish_stage, ranking_stream
+from .fragments import get_stage_lineup
+from .scoring import scoring_mode, get_points_totals
+from .analytics import get_stage_analytics, closest_voters
+from .leaderboard import global_version, get_leaderboard
+from .invalidation import known_version
 from .forms import LoginForm, GradeForm
 from .country_flags import country_flags, get_flag_emoji
-from datetime import datetime
 import csv
 import io
 
+# Rows shown in the import preview; the full upload is staged on disk
+PREVIEW_ROWS = 50
+# Parse errors listed before the rest are summarised
+MAX_IMPORT_ERRORS = 5
+# Seconds clients wait before retrying a vote the write-behind queue had no room for
+BUSY_RETRY_AFTER = 1
+
+
+def busy_response():
+    """503 response asking the client to retry a vote the write-behind queue refused"""
+    response = jsonify({'success': False, 'busy': True,
+                        'message': "Lots of votes are coming in right now. Retrying..."})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(BUSY_RETRY_AFTER)
+    return response
+
 def configure_routes(app):
     # Register all routes with the app
     @app.route('/logout')
@@ -31,20 +61,30 @@ def configure_routes(app):
                 try:
                     user = User(username=username)
                     db.session.add(user)
+                    bump_versions(USERS_KEY)
                     db.session.commit()
                     flash(f"Welcome, {username}! Your account has been created.", "success")
                 except Exception as e:
                     db.session.rollback()
                     flash(f"Error creating user: {str(e)}", "danger")
-                    return render_template('index.html', form=form, stages=[])
+                    return render_template('index.html', form=form, stages=[], completion={})
             
             # Store user info in session
             session['user_id'] = user.id
             session['username'] = username
             flash(f"Welcome back, {username}!", "success")
             
-        stages = Stage.query.all()
-        return render_template('index.html', form=form, stages=stages)
+        # Stage cards come from the leaderboard aggregate, cached per global version
+        stages = []
+        completion = {}
+        if 'user_id' in session:
+            overview = get_leaderboard(global_version())
+            stages = overview.summaries
+            ballot = overview.ballots.get(session['user_id'], {})
+            completion = {summary.id: round(100 * ballot.get(summary.id, 0) / summary.countries)
+                          if summary.countries else 0
+                          for summary in stages}
+        return render_template('index.html', form=form, stages=stages, completion=completion)
 
     @app.route('/stage/<int:stage_id>')
     def stage(stage_id):
@@ -61,100 +101,118 @@ def configure_routes(app):
             session.pop('username', None)
             return redirect(url_for('index'))
 
+        # The page only changes with the stage version (grades, lineup), the set
+        # of users and the viewer, so unchanged pages are answered with 304
+        # before any ranking query runs. Queued votes and flash messages are
+        # not covered by the versions, so such pages are always rendered.
+        versions = get_versions(stage_key(stage_id), lineup_key(stage_id), USERS_KEY)
+        etag = None
+        if not has_pending(stage_id) and not session.get('_flashes'):
+            etag = make_etag('stage', stage_id, versions[stage_key(stage_id)], versions[USERS_KEY], user_id,
+                             request.args.get('scoring'))
+            cached = not_modified(etag)
+            if cached is not None:
+                return cached
+
         stage = Stage.query.get_or_404(stage_id)
 
         # Latest grades by country for this user/stage
-        latest = (
-            db.session.query(
-                Grade.country_id,
-                db.func.max(Grade.timestamp).label('ts')
-            )
+        committed = {
+            country_id: (value, timestamp) for country_id, value, timestamp in
+            db.session.query(CurrentGrade.country_id, CurrentGrade.value, CurrentGrade.timestamp)
             .filter_by(user_id=user_id, stage_id=stage_id)
-            .group_by(Grade.country_id)
             .all()
-        )
-        grades = {}
-        for country_id, ts in latest:
-            g = Grade.query.filter_by(
-                user_id=user_id,
-                stage_id=stage_id,
-                country_id=country_id,
-                timestamp=ts
-            ).first()
-            if g:
-                grades[country_id] = g.value
-
-        # Fetch countries for this stage, ordered by performance order
-        countries = (
-            Country.query
-            .join(StageCountry, Country.id == StageCountry.country_id)
-            .filter(StageCountry.stage_id == stage_id)
-            .order_by(StageCountry.order)
-            .all()
-        )
+        }
+        grades = {country_id: value for country_id, (value, _) in committed.items()}
+        # Show the user's own votes that are still waiting to be written, whichever worker queued them
+        grades.update(pending_grades(stage_id, committed))
 
-        # User votes count
+        # Countries in performance order with their voting-row cells pre-rendered;
+        # only rebuilt when the lineup version moves on
+        stage_lineup = get_stage_lineup(stage_id, versions[lineup_key(stage_id)])
+        countries = stage_lineup.countries
+
+        # Votes cast and favourite country of every user, in one query
         users = User.query.all()
-        user_votes = {}
-        for u in users:
-            count = (
-                Grade.query
-                .filter_by(user_id=u.id, stage_id=stage_id)
-                .distinct(Grade.country_id)
-                .count()
-            )
-            user_votes[u.id] = count
-
-        # User favorite country (highest grade)
-        user_favorites = {}
-        for u in users:
-            fav = (
-                db.session.query(Grade.country_id)
-                .filter_by(user_id=u.id, stage_id=stage_id)
-                .order_by(Grade.value.desc())
-                .first()
-            )
-            if fav:
-                user_favorites[u.id] = Country.query.get(fav.country_id)
+        summaries = voter_summaries(stage_id)
 
         # Calculate rankings for this stage (sorted by total score)
-        rankings = []
-        for country in countries:
-            total_grade = 0
-            
-            # Get all users
-            all_users = User.query.all()
-            
-            for u in all_users:
-                # Get the latest grade from this user for this country
-                latest_grade = db.session.query(
-                    Grade
-                ).filter_by(
-                    user_id=u.id,
-                    stage_id=stage_id,
-                    country_id=country.id
-                ).order_by(
-                    Grade.timestamp.desc()
-                ).first()
-                
-                if latest_grade:
-                    total_grade += latest_grade.value
-            
-            if total_grade > 0:
-                rankings.append((country, total_grade))
-        
-        # Sort rankings by total grade (highest first)
-        ranking_items = sorted(rankings, key=lambda x: x[1], reverse=True)
-        
-        return render_template('stage.html',
+        scoring = scoring_mode(stage, request.args.get('scoring'))
+        if scoring == 'points':
+            ranking_version = versions[stage_key(stage_id)]
+            totals = get_points_totals(stage_id, ranking_version)
+        else:
+            ranking_version, totals = get_scoreboard(stage_id, versions[stage_key(stage_id)]).snapshot()
+        rankings = ranking_items(totals, countries)
+
+        response = make_response(render_template('stage.html',
                             stage=stage,
                             countries=countries,
                             grades=grades,
                             users=users,
-                            user_votes=user_votes,
-                            user_favorites=user_favorites,
+                            voter_summaries=summaries,
                             country_flags=country_flags,
-                            ranking_items=ranking_items)
+                            ranking_items=rankings,
+                            ranking_version=ranking_version,
+                            live_rankings=LIVE_RANKINGS,
+                            poll_seconds=POLL_SECONDS,
+                            scoring=scoring,
+                            lineup_cells=stage_lineup.cells,
+                            lineup=stage_lineup.lineup))
+        if etag is not None:
+            with_etag(response, etag)
+        return response
+
+    @app.route('/stage/<int:stage_id>/rankings')
+    def stage_rankings(stage_id):
+        """Current rankings of a stage as JSON, answered with 304 while the stage version is unchanged"""
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': "Please log in to view stages"}), 401
+
+        # Stage pages poll here; the listener's copy of the version spares each poll a query
+        version = known_version(stage_key(stage_id))
+        if version is None:
+            version = get_versions(stage_key(stage_id))[stage_key(stage_id)]
+        etag = make_etag('rankings', stage_id, version, request.args.get('scoring'))
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        stage = Stage.query.get_or_404(stage_id)
+        scoring = scoring_mode(stage, request.args.get('scoring'))
+        if scoring == 'points':
+            totals = get_points_totals(stage_id, version)
+        else:
+            _, totals = get_scoreboard(stage_id, version).snapshot()
+        # The stage version in both modes, as in the ETag; the totals reflect at least this version
+        return with_etag(jsonify({
+            'success': True,
+            'scoring': scoring,
+            'rankings': rankings_data(totals),
+            'version': version
+        }), etag)
+
+    @app.route('/stage/<int:stage_id>/rankings/stream')
+    def rankings_stream(stage_id):
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': "Please log in to view stages"}), 401
+
+        Stage.query.get_or_404(stage_id)
+        if LIVE_RANKINGS != 'stream':
+            # Streams are off (they would tie up a worker thread each); 204 stops EventSource reconnects
+            return Response(status=204)
+
+        # All subscribers of a stage share one broadcaster fed by the scoreboard,
+        # so idle streams never touch the database
+        stage_version = get_versions(stage_key(stage_id))[stage_key(stage_id)]
+        version, totals = get_scoreboard(stage_id, stage_version).snapshot()
+        broadcaster = get_broadcaster(stage_id, version, totals)
+        broadcaster.publish(version, totals)
+
+        response = Response(ranking_stream(broadcaster), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
 
   
     @app.route('/fill-db', methods=['GET', 'POST'])
@@ -177,7 +235,8 @@ def configure_routes(app):
         preview_data = None
         selected_stage = None
         clear_existing = False
-        csv_data_json = None
+        import_token = None
+        total_rows = 0
         
         if request.method == 'POST':
             # Get form data
@@ -198,41 +257,53 @@ def configure_routes(app):
                 flash("Invalid stage selected", "danger")
                 return redirect(url_for('fill_db'))
                 
-            # Get CSV data from textarea
-            csv_data_text = request.form.get('csv_data')
-            
-            if not csv_data_text or csv_data_text.strip() == '':
-                flash("No CSV data provided", "danger")
-                return redirect(url_for('fill_db'))
-                
-            # Read and validate CSV
+            # Prefer an uploaded file and stream it; fall back to pasted text
+            csv_file = request.files.get('csv_file')
+            if csv_file and csv_file.filename:
+                stream = io.TextIOWrapper(csv_file.stream, encoding='utf-8-sig', newline='')
+            else:
+                csv_data_text = request.form.get('csv_data')
+                if not csv_data_text or csv_data_text.strip() == '':
+                    flash("No CSV data provided", "danger")
+                    return redirect(url_for('fill_db'))
+                stream = io.StringIO(csv_data_text, newline='')
+
+            # Validate row by row, staging valid rows on disk and keeping only a preview
+            staged = StagedImport({'stage': stage_id, 'clear_existing': clear_existing,
+                                   'user_id': user_id})
+            preview_data = []
+            errors = []
             try:
-                # Read CSV data from textarea
-                stream = io.StringIO(csv_data_text, newline=None)
-                csv_data = list(csv.DictReader(stream))
-                
-                # Validate CSV structure
-                required_fields = ['position', 'country', 'artist', 'song']
-                for field in required_fields:
-                    if not all(field in row for row in csv_data):
-                        flash(f"CSV is missing required field: {field}", "danger")
-                        return redirect(url_for('fill_db'))
-                
-                # Prepare preview data
-                preview_data = csv_data
-                csv_data_json = json.dumps(csv_data)
-                
-                flash(f"CSV file validated successfully. {len(csv_data)} entries found.", "success")
-                
-            except Exception as e:
-                flash(f"Error processing CSV file: {str(e)}", "danger")
+                for _, row, error in read_lineup_csv(stream):
+                    if error:
+                        errors.append(error)
+                        continue
+                    staged.add(row)
+                    if len(preview_data) < PREVIEW_ROWS:
+                        preview_data.append(row)
+            except (UnicodeDecodeError, csv.Error) as e:
+                errors.append(f"Error processing CSV file: {str(e)}")
+
+            if errors or staged.count == 0:
+                staged.discard()
+                for error in errors[:MAX_IMPORT_ERRORS]:
+                    flash(error, "danger")
+                if len(errors) > MAX_IMPORT_ERRORS:
+                    flash(f"...and {len(errors) - MAX_IMPORT_ERRORS} more errors", "danger")
+                if not errors:
+                    flash("CSV contains no entries", "danger")
                 return redirect(url_for('fill_db'))
+
+            import_token = staged.commit()
+            total_rows = staged.count
+            flash(f"CSV file validated successfully. {total_rows} entries found.", "success")
         
         return render_template('fill_db.html',
                               preview_data=preview_data,
                               selected_stage=selected_stage,
                               clear_existing=clear_existing,
-                              csv_data_json=csv_data_json,
+                              import_token=import_token,
+                              total_rows=total_rows,
                               country_flags=country_flags)
     
     @app.route('/confirm-fill-db', methods=['POST'])
@@ -250,18 +321,19 @@ def configure_routes(app):
             session.pop('username', None)
             return redirect(url_for('index'))
             
-        # Get form data
-        stage_id = request.form.get('stage')
-        clear_existing = request.form.get('clear_existing') == 'True'
-        csv_data_json = request.form.get('csv_data')
+        # Load the rows staged by the upload step
+        import_token = request.form.get('import_token')
+        staged = load_staged(import_token, user_id)
         
-        if not csv_data_json:
-            flash("No data provided", "danger")
+        if not staged:
+            flash("The upload has expired or was not found. Please upload the CSV again.", "danger")
             return redirect(url_for('fill_db'))
             
+        meta, csv_data = staged
+        stage_id = meta.get('stage')
+        clear_existing = bool(meta.get('clear_existing'))
+            
         try:
-            # Parse JSON data
-            csv_data = json.loads(csv_data_json)
             
             # Map stage_id to actual stage names
             stage_map = {
@@ -276,73 +348,19 @@ def configure_routes(app):
                 flash("Invalid stage selected", "danger")
                 return redirect(url_for('fill_db'))
                 
-            # Get or create stage
-            stage = Stage.query.filter_by(display_name=stage_name).first()
-            if not stage:
-                stage = Stage(display_name=stage_name)
-                db.session.add(stage)
-                db.session.commit()
-                
-            # Clear existing countries if requested
+            # Load the whole lineup with set-based statements in one transaction
+            stage, stats = import_lineup(stage_name, csv_data, clear_existing)
+            invalidate_scoreboard(stage.id)
+            publish_stage(stage.id)
+            discard_staged(import_token)
+
+            timings = stats['timings']
+            current_app.logger.info("Imported %d rows into %s: %s", len(csv_data), stage_name,
+                                    ", ".join(f"{phase} {ms}" for phase, ms in timings.items()))
             if clear_existing:
-                # Get all countries in this stage
-                stage_countries = StageCountry.query.filter_by(stage_id=stage.id).all()
-                
-                # Remove countries from stage
-                for sc in stage_countries:
-                    db.session.delete(sc)
-                    
-                db.session.commit()
                 flash(f"Cleared existing countries from {stage_name}", "info")
-            
-            # Add countries from CSV
-            countries_added = 0
-            for row in csv_data:
-                country_name = row['country'].strip()
-                artist = row['artist'].strip()
-                song = row['song'].strip()
-                
-                # Get position from CSV (or use index+1 if not provided or invalid)
-                try:
-                    position = int(row['position'].strip())
-                    if position < 1:
-                        position = countries_added + 1
-                except (ValueError, KeyError):
-                    position = countries_added + 1
-                
-                # Check if country already exists
-                country = Country.query.filter_by(display_name=country_name).first()
-                
-                if not country:
-                    # Create new country
-                    country = Country(display_name=country_name, artist=artist, song=song)
-                    db.session.add(country)
-                else:
-                    # Update existing country
-                    country.artist = artist
-                    country.song = song
-                
-                # Add country to stage if not already there
-                existing_stage_country = StageCountry.query.filter_by(
-                    stage_id=stage.id,
-                    country_id=country.id
-                ).first()
-                
-                if not existing_stage_country:
-                    # Create new association with order from CSV
-                    new_stage_country = StageCountry(
-                        stage_id=stage.id,
-                        country_id=country.id,
-                        order=position
-                    )
-                    db.session.add(new_stage_country)
-                    countries_added += 1
-                else:
-                    # Update existing association with new order
-                    existing_stage_country.order = position
-            
-            db.session.commit()
-            flash(f"Successfully added {countries_added} countries to {stage_name}", "success")
+            flash(f"Successfully added {stats['countries_added']} countries to {stage_name} "
+                  f"in {timings['total_ms']} ms", "success")
             
             return redirect(url_for('stage', stage_id=stage.id))
             
@@ -384,67 +402,143 @@ def configure_routes(app):
             flash("Invalid grade value", "danger")
             return redirect(url_for('stage', stage_id=stage_id))
 
-        # Always create a new grade with the current timestamp
-        # This ensures we have a history of all votes and can get the latest one
-        new_grade = Grade(
-            user_id=user_id,
-            stage_id=stage_id,
-            country_id=country_id,
-            value=grade_value,
-            timestamp=datetime.utcnow()
-        )
-        db.session.add(new_grade)
+        if db.session.get(StageCountry, (stage_id, country_id)) is None:
+            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                return jsonify({'success': False, 'message': "Country not found in this stage"})
+            flash("Country not found in this stage", "danger")
+            return redirect(url_for('stage', stage_id=stage_id))
 
-        db.session.commit()
+        vote_buffer = get_vote_buffer()
+        if vote_buffer is None:
+            # Always append a new grade to the history and update the current grade
+            # in the same transaction, so reads never have to scan the history
+            previous_value = record_grade(user_id, stage_id, country_id, grade_value)
+            stage_version = bump_versions(stage_key(stage_id))[stage_key(stage_id)]
+
+            db.session.commit()
+
+            # Apply the vote to the in-memory scoreboard as a delta instead of re-aggregating
+            apply_votes(stage_id, [(country_id, previous_value, grade_value)], stage_version)
+            publish_stage(stage_id)
+        else:
+            # Write-behind: queue the vote and acknowledge it; the buffer writes it
+            # in the next batch and then updates the scoreboard
+            stage_version = None
+            try:
+                timestamp = vote_buffer.submit(user_id, stage_id, {country_id: grade_value})
+            except BufferFull:
+                if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+                    return busy_response()
+                flash("Lots of votes are coming in right now. Please try again.", "warning")
+                return redirect(url_for('stage', stage_id=stage_id))
+            remember_pending(stage_id, {country_id: grade_value}, timestamp)
         
         # Handle AJAX requests
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            # Get updated rankings for this stage using the same logic as in the stage route
-            rankings = []
-            
-            # Get all countries in this stage
-            countries_in_stage = Country.query.join(StageCountry).filter(StageCountry.stage_id == stage_id).all()
-            
-            for country in countries_in_stage:
-                total_grade = 0
-                
-                # Get all users
-                all_users = User.query.all()
-                
-                for user in all_users:
-                    # Get the latest grade from this user for this country
-                    latest_grade = db.session.query(
-                        Grade
-                    ).filter_by(
-                        user_id=user.id,
-                        stage_id=stage_id,
-                        country_id=country.id
-                    ).order_by(
-                        Grade.timestamp.desc()
-                    ).first()
-                    
-                    if latest_grade:
-                        total_grade += latest_grade.value
-                
-                if total_grade > 0:
-                    rankings.append((country.id, total_grade))
-            
-            # Sort rankings by total grade (highest first)
-            rankings.sort(key=lambda x: x[1], reverse=True)
-
-            
-            # Format rankings for JSON response
-            rankings_data = [{'country_id': country_id, 'total_grade': total_grade}
-                            for country_id, total_grade in rankings]
-            
+            # Get updated rankings for this stage from the same scoreboard as the stage route,
+            # at least as new as our own vote
+            version, totals = get_scoreboard(stage_id, stage_version).snapshot()
             return jsonify({
                 'success': True,
                 'message': "Your vote has been recorded!",
-                'rankings': rankings_data
+                'rankings': rankings_data(totals),
+                'version': version
             })
             
         flash("Your vote has been recorded!", "success")
         return redirect(url_for('stage', stage_id=stage_id))
+
+    @app.route('/stage/<int:stage_id>/ballot', methods=['POST'])
+    def submit_ballot(stage_id):
+        """Record a batch of grades for one stage in a single transaction.
+
+        Expects a JSON body of the form {"grades": {"<country_id>": <grade>, ...}}.
+        """
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'message': "Please log in to vote"})
+
+        user_id = session['user_id']
+
+        # Verify user exists in database
+        user = User.query.get(user_id)
+        if not user:
+            session.pop('user_id', None)
+            session.pop('username', None)
+            return jsonify({'success': False, 'message': "User not found. Please log in again."})
+
+        payload = request.get_json(silent=True) or {}
+        submitted = payload.get('grades')
+        if not isinstance(submitted, dict) or not submitted:
+            return jsonify({'success': False, 'message': "No grades provided"}), 400
+
+        # Validate the whole ballot in one pass against the stage lineup
+        lineup = {
+            country_id for (country_id,) in
+            db.session.query(StageCountry.country_id).filter_by(stage_id=stage_id).all()
+        }
+        values = {}
+        errors = {}
+        for key, raw_value in submitted.items():
+            try:
+                country_id = int(key)
+            except (ValueError, TypeError):
+                errors[key] = "Invalid country"
+                continue
+            if country_id not in lineup:
+                errors[key] = "Country not found in this stage"
+                continue
+            try:
+                grade_value = int(raw_value)
+            except (ValueError, TypeError):
+                errors[key] = "Invalid grade value"
+                continue
+            if not 1 <= grade_value <= 12:
+                errors[key] = "Grade must be between 1 and 12"
+                continue
+            values[country_id] = grade_value
+
+        if errors:
+            return jsonify({'success': False, 'message': "Some grades are invalid", 'errors': errors}), 400
+
+        vote_buffer = get_vote_buffer()
+        if vote_buffer is None:
+            changes = record_grades(user_id, stage_id, values, skip_unchanged=True)
+            stage_version = None
+            if changes:
+                stage_version = bump_versions(stage_key(stage_id))[stage_key(stage_id)]
+            db.session.commit()
+
+            apply_votes(stage_id, changes, stage_version)
+            publish_stage(stage_id)
+            saved = len(changes)
+        else:
+            # Only queue grades that change what the user has, counting their queued votes
+            committed = {
+                country_id: (value, timestamp) for country_id, value, timestamp in
+                db.session.query(CurrentGrade.country_id, CurrentGrade.value, CurrentGrade.timestamp)
+                .filter_by(user_id=user_id, stage_id=stage_id)
+                .all()
+            }
+            current = {country_id: value for country_id, (value, _) in committed.items()}
+            current.update(pending_grades(stage_id, committed))
+            values = {country_id: value for country_id, value in values.items() if current.get(country_id) != value}
+            if values:
+                try:
+                    timestamp = vote_buffer.submit(user_id, stage_id, values, skip_unchanged=True)
+                except BufferFull:
+                    return busy_response()
+                remember_pending(stage_id, values, timestamp)
+            saved = len(values)
+            stage_version = None
+
+        version, totals = get_scoreboard(stage_id, stage_version).snapshot()
+        return jsonify({
+            'success': True,
+            'message': "Your votes have been recorded!",
+            'saved': saved,
+            'rankings': rankings_data(totals),
+            'version': version
+        })
         
     @app.route('/stage/<int:stage_id>/user/<int:user_id>')
     def user_votes(stage_id, user_id):
@@ -468,33 +562,14 @@ def configure_routes(app):
             flash("The requested user does not exist.", "danger")
             return redirect(url_for('stage', stage_id=stage_id))
         
-        # Get all grades for this user in this stage, ensuring no duplicates
-        # Use distinct to get only the latest grade for each country
-        latest_grades = db.session.query(
-            Grade.country_id,
-            db.func.max(Grade.timestamp).label('latest_timestamp')
-        ).filter_by(
-            user_id=user_id,
-            stage_id=stage_id
-        ).group_by(Grade.country_id).all()
-        
-        # Create a list of (country, grade) tuples
-        user_grades = []
-        for country_id, latest_timestamp in latest_grades:
-            # Get the grade with the latest timestamp
-            grade = Grade.query.filter_by(
-                user_id=user_id,
-                stage_id=stage_id,
-                country_id=country_id,
-                timestamp=latest_timestamp
-            ).first()
-            
-            if grade:
-                country = Country.query.get(grade.country_id)
-                user_grades.append((country, grade.value))
-            
-        # Sort by grade value (highest first)
-        user_grades.sort(key=lambda x: x[1], reverse=True)
+        # Get the current grade for each country in this stage, highest first
+        user_grades = (
+            db.session.query(Country, CurrentGrade.value)
+            .join(CurrentGrade, CurrentGrade.country_id == Country.id)
+            .filter(CurrentGrade.user_id == user_id, CurrentGrade.stage_id == stage_id)
+            .order_by(CurrentGrade.value.desc())
+            .all()
+        )
         
         return render_template('user_votes.html',
                               user=user,
@@ -502,6 +577,47 @@ def configure_routes(app):
                               user_grades=user_grades,
                               country_flags=country_flags)
                               
+    @app.route('/stage/<int:stage_id>/analytics')
+    def stage_analytics(stage_id):
+        if 'user_id' not in session:
+            flash("Please log in to view stages", "warning")
+            return redirect(url_for('index'))
+
+        user_id = session['user_id']
+        versions = get_versions(stage_key(stage_id), lineup_key(stage_id))
+        etag = make_etag('analytics', stage_id, versions[stage_key(stage_id)], user_id)
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        stage = Stage.query.get_or_404(stage_id)
+        # Similarity, blocs and outliers are computed once per stage version
+        analytics = get_stage_analytics(stage_id, versions[stage_key(stage_id)])
+        countries = {country.id: country
+                     for country in get_stage_lineup(stage_id, versions[lineup_key(stage_id)]).countries}
+
+        return with_etag(make_response(render_template('analytics.html',
+                                                       stage=stage,
+                                                       analytics=analytics,
+                                                       countries=countries,
+                                                       matches=closest_voters(analytics, user_id))), etag)
+
+    @app.route('/leaderboard')
+    def leaderboard():
+        if 'user_id' not in session:
+            flash("Please log in to view the leaderboard", "warning")
+            return redirect(url_for('index'))
+
+        # Cached per global version (the sum of all stage versions)
+        version = global_version()
+        etag = make_etag('leaderboard', version, session['user_id'])
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+
+        return with_etag(make_response(render_template('leaderboard.html',
+                                                       leaderboard=get_leaderboard(version))), etag)
+
     @app.route('/stage/<int:stage_id>/update_order/<int:country_id>', methods=['POST'])
     def update_country_order(stage_id, country_id):
         if 'user_id' not in session:
@@ -547,7 +663,10 @@ def configure_routes(app):
             
         # Update the order
         stage_country.order = new_order
+        bump_versions(stage_key(stage_id), lineup_key(stage_id))
         db.session.commit()
+        invalidate_scoreboard(stage_id)
+        publish_stage(stage_id)
         
         # Handle AJAX requests
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
@@ -0,0 +1,80 @@
+from .models import db
+
+
+def ensure_indexes():
+    """Create any index declared on the models that is missing from the database.
+
+    db.create_all() only creates indexes together with new tables, so databases
+    created before an index was added need this. Safe to run repeatedly on
+    SQLite and PostgreSQL. Returns the names of the indexes that were created.
+    """
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(bind=db.engine, checkfirst=True)
+                created.append(index.name)
+    return created
+
+
+def ensure_columns():
+    """Add nullable columns declared on the models that are missing from existing tables.
+
+    Like ensure_indexes, this covers databases created before a column was
+    added. Returns the added columns as 'table.column' names.
+    """
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = db.engine.dialect.identifier_preparer
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                print(f"⚠️ Cannot add NOT NULL column {table.name}.{column.name} automatically")
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.execute(db.text(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.format_column(column)} {column_type}"
+                ))
+            added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def migrate_association_table():
+    """Move rows from the old association table into StageCountry and drop it.
+
+    Countries get their running order from their position in the old table.
+    Returns the number of migrated associations, or None when there is no old
+    table to migrate.
+    """
+    from .models import StageCountry
+
+    if not db.inspect(db.engine).has_table('association'):
+        return None
+
+    rows = db.session.execute(db.text("SELECT stage_id, country_id FROM association")).all()
+    stage_counters = {}
+    associations = []
+    for stage_id, country_id in rows:
+        stage_counters[stage_id] = stage_counters.get(stage_id, 0) + 1
+        associations.append({'stage_id': stage_id, 'country_id': country_id,
+                             'order': stage_counters[stage_id]})
+
+    db.session.execute(db.delete(StageCountry))
+    if associations:
+        db.session.execute(db.insert(StageCountry), associations)
+    db.session.execute(db.text("DROP TABLE association"))
+    db.session.commit()
+    return len(associations)
@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from .models import db, VersionCounter
+from .ranking import stage_aggregates_query, sort_totals
+from .versions import stage_key, get_versions
+
+# Verify a scoreboard against the Grade history every N applied votes (0 disables)
+VERIFY_INTERVAL = int(os.getenv('SCOREBOARD_VERIFY_INTERVAL', '500'))
+# Rebuild a scoreboard from the database once it is this many seconds old (0 never).
+# Needed with several worker processes, where each only sees its own votes.
+MAX_AGE = float(os.getenv('SCOREBOARD_MAX_AGE', '0'))
+
+
+class StageScoreboard:
+    """In-process per-country totals and voter counts for one stage.
+
+    Built once from the database and then kept up to date by applying each
+    vote as a delta. ``version`` is the shared stage version (see
+    versions.py) the scoreboard reflects, so versions from different worker
+    processes can be compared.
+    """
+
+    def __init__(self, stage_id, rows, version):
+        self.stage_id = stage_id
+        self.orders = {country_id: order for country_id, _, _, order in rows}
+        self.totals = {country_id: total for country_id, total, _, _ in rows}
+        self.voters = {country_id: voters for country_id, _, voters, _ in rows}
+        self.version = version
+        self.built_at = time.monotonic()
+        self.applied = 0
+        self.lock = threading.Lock()
+
+    def apply(self, changes, version):
+        """Apply (country_id, old_value, new_value) deltas committed under stage version"""
+        with self.lock:
+            self.version = version
+            changed = False
+            for country_id, old_value, new_value in changes:
+                if country_id not in self.orders:
+                    # Votes for countries outside the lineup never show up in rankings
+                    continue
+                self.totals[country_id] += new_value - (old_value or 0)
+                if old_value is None:
+                    self.voters[country_id] += 1
+                changed = True
+            if changed:
+                self.applied += 1
+
+    def snapshot(self):
+        """Return (version, [(country_id, total), ...]) sorted like stage_totals"""
+        with self.lock:
+            rows = [(country_id, total, self.orders[country_id])
+                    for country_id, total in self.totals.items()]
+            version = self.version
+        return version, sort_totals(rows)
+
+    def matches(self, rows):
+        """Check whether aggregate rows from the database agree with this scoreboard"""
+        with self.lock:
+            return (
+                {country_id: (total, voters) for country_id, total, voters, _ in rows}
+                == {country_id: (self.totals[country_id], self.voters[country_id]) for country_id in self.orders}
+            )
+
+
+_scoreboards = {}
+_registry_lock = threading.Lock()
+
+
+def load_stage(stage_id, from_history=False):
+    """Return (rows, db_version): stage_aggregates rows and the stage version they reflect.
+
+    Both come from one statement, so they always describe the same committed
+    state; reading the version separately could miss or double count a vote
+    committed in between.
+    """
+    version = (
+        db.session.query(VersionCounter.value)
+        .filter(VersionCounter.key == stage_key(stage_id))
+        .scalar_subquery()
+    )
+    rows = stage_aggregates_query(stage_id, from_history).add_columns(version).all()
+    if not rows:
+        # Empty lineup: there are no totals that could be counted twice
+        return [], get_versions(stage_key(stage_id))[stage_key(stage_id)]
+    return ([(country_id, int(total), int(voters), order) for country_id, total, voters, order, _ in rows],
+            rows[0][4] or 0)
+
+
+def _install(stage_id, rows, version):
+    """Register a freshly built scoreboard unless the loaded one reflects a newer stage version"""
+    with _registry_lock:
+        current = _scoreboards.get(stage_id)
+        if current is not None and current.version > version:
+            return current
+        board = StageScoreboard(stage_id, rows, version)
+        _scoreboards[stage_id] = board
+        return board
+
+
+def get_scoreboard(stage_id, db_version=None):
+    """Return the scoreboard for a stage, building it from the database on first use,
+    once it is older than MAX_AGE, or when it reflects less than db_version.
+
+    A rebuilt scoreboard records the exact stage version it was loaded at.
+    """
+    board = _scoreboards.get(stage_id)
+    # A board ahead of db_version (read from a lagging replica) is kept; versions only grow
+    if (board is None
+            or (MAX_AGE and time.monotonic() - board.built_at > MAX_AGE)
+            or (db_version is not None and board.version < db_version)):
+        rows, loaded = load_stage(stage_id)
+        board = _install(stage_id, rows, loaded)
+    return board
+
+
+def apply_votes(stage_id, changes, db_version=None):
+    """Apply (country_id, old_value, new_value) deltas to a stage's scoreboard if it is loaded.
+
+    Call after the votes have been committed, with the stage version they
+    were committed under. The deltas are only applied to a scoreboard at the
+    version right before it. A scoreboard rebuilt after the commit already
+    counts the votes and is left alone; one that missed another change in
+    between is dropped. Returns the scoreboard's stage version, or None when no
+    scoreboard is loaded (it will be built from the database on next read
+    and will include these votes).
+    """
+    with _registry_lock:
+        board = _scoreboards.get(stage_id)
+        if board is None:
+            return None
+        if db_version is None or board.version >= db_version:
+            return board.version
+        if board.version != db_version - 1:
+            del _scoreboards[stage_id]
+            return None
+        applied = board.applied
+        board.apply(changes, db_version)
+    if VERIFY_INTERVAL and board.applied != applied and board.applied % VERIFY_INTERVAL == 0:
+        verify_scoreboard(stage_id)
+    return db_version
+
+
+def loaded_version(stage_id):
+    """The shared stage version the loaded scoreboard reflects, or None if not loaded"""
+    board = _scoreboards.get(stage_id)
+    return board.version if board is not None else None
+
+
+def invalidate_scoreboard(stage_id=None):
+    """Drop the scoreboard for one stage (or all stages) so it is rebuilt on next read"""
+    with _registry_lock:
+        if stage_id is None:
+            _scoreboards.clear()
+        else:
+            _scoreboards.pop(stage_id, None)
+
+
+def verify_scoreboard(stage_id):
+    """Compare a stage's scoreboard with the Grade history and rebuild it on drift.
+
+    Returns True if the scoreboard was consistent (or not loaded, or at another
+    stage version than the history read), False if drift was detected and
+    the scoreboard was rebuilt.
+    """
+    board = _scoreboards.get(stage_id)
+    if board is None:
+        return True
+    rows, loaded = load_stage(stage_id, from_history=True)
+    if board.version != loaded or board.matches(rows):
+        # Votes committed between the two reads are checked at the next interval
+        return True
+    print(f"⚠️ Scoreboard drift detected for stage {stage_id} - rebuilding from grade history")
+    _install(stage_id, rows, loaded)
+    return False
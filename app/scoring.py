@@ -0,0 +1,108 @@
+import threading
+import numpy as np
+from .models import db, CurrentGrade, StageCountry
+
+# 'grades' sums the raw 1-12 grades; 'points' turns every ballot into Eurovision points
+SCORING_MODES = ('grades', 'points')
+# Points for a voter's favourite, second favourite, ... tenth favourite
+EUROVISION_POINTS = np.array([12, 10, 8, 7, 6, 5, 4, 3, 2, 1], dtype=np.int64)
+
+_points_cache = {}
+_points_lock = threading.Lock()
+
+
+def scoring_mode(stage, requested=None):
+    """Scoring mode to show for a stage: a valid ?scoring= value wins over the stage setting"""
+    if requested in SCORING_MODES:
+        return requested
+    return stage.scoring if stage.scoring in SCORING_MODES else 'grades'
+
+
+def grade_matrix(stage_id):
+    """Current grades of a stage as a users × countries matrix, built from one query.
+
+    Returns (user_ids, country_ids, matrix). Columns follow the performance
+    order of the lineup, rows are sorted by user id, and 0 marks a country
+    the user has not graded. Grades for countries outside the lineup are
+    left out.
+    """
+    rows = db.session.execute(
+        db.select(StageCountry.country_id, StageCountry.order, CurrentGrade.user_id, CurrentGrade.value)
+        .outerjoin(CurrentGrade, db.and_(
+            CurrentGrade.stage_id == StageCountry.stage_id,
+            CurrentGrade.country_id == StageCountry.country_id
+        ))
+        .where(StageCountry.stage_id == stage_id)
+    ).all()
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros((0, 0), dtype=np.int16)
+
+    # NULLs (no order, no grade) become NaN. Plain tuples convert far faster than Row objects
+    data = np.array([tuple(row) for row in rows], dtype=np.float64)
+    country_ids, first_row, country_index = np.unique(data[:, 0], return_index=True, return_inverse=True)
+    orders = np.nan_to_num(data[first_row, 1], nan=np.inf)
+    # Columns in performance order; countries without an order go last, by id
+    columns = np.lexsort((country_ids, orders))
+    column_of = np.empty_like(columns)
+    column_of[columns] = np.arange(len(columns))
+
+    graded = ~np.isnan(data[:, 2])
+    user_ids, user_index = np.unique(data[graded, 2], return_inverse=True)
+    matrix = np.zeros((len(user_ids), len(columns)), dtype=np.int16)
+    matrix[user_index, column_of[country_index[graded]]] = data[graded, 3]
+    return user_ids.astype(np.int64), country_ids[columns].astype(np.int64), matrix
+
+
+def eurovision_points(matrix):
+    """Points every user awards every country: 12, 10, 8-1 to their ten highest grades.
+
+    Within a ballot, equal grades are ranked by performance order (lower
+    column first). Ungraded countries never receive points.
+    """
+    points = np.zeros(matrix.shape, dtype=np.int64)
+    places = min(len(EUROVISION_POINTS), matrix.shape[1])
+    if not matrix.size or not places:
+        return points
+    # A stable sort on the negated grades keeps ties in column order
+    ranked = np.argsort(-matrix, axis=1, kind='stable')[:, :places]
+    np.put_along_axis(points, ranked, EUROVISION_POINTS[:places], axis=1)
+    points[matrix <= 0] = 0
+    return points
+
+
+def points_totals(stage_id):
+    """Eurovision points per country in a stage as a list of (country_id, total), highest first.
+
+    Ties are broken by the number of voters who gave the country any points,
+    then by the number of 12s, 10s, 8s and so on, then by performance order.
+    Countries without points are left out, as in sort_totals.
+    """
+    _, country_ids, matrix = grade_matrix(stage_id)
+    points = eurovision_points(matrix)
+    totals = points.sum(axis=0)
+    # np.lexsort sorts by the last key first, so list the keys from least to most significant
+    keys = [np.arange(len(country_ids))]
+    keys += [-(points == value).sum(axis=0) for value in EUROVISION_POINTS[::-1]]
+    keys += [-(points > 0).sum(axis=0), -totals]
+    return [(int(country_ids[index]), int(totals[index]))
+            for index in np.lexsort(keys) if totals[index] > 0]
+
+
+def get_points_totals(stage_id, db_version=None):
+    """points_totals for a stage, reused while its shared stage version is unchanged"""
+    if db_version is not None:
+        with _points_lock:
+            cached = _points_cache.get(stage_id)
+        if cached is not None and cached[0] == db_version:
+            return cached[1]
+    totals = points_totals(stage_id)
+    if db_version is not None:
+        with _points_lock:
+            _points_cache[stage_id] = (db_version, totals)
+    return totals
+
+
+def invalidate_points_totals(stage_id):
+    """Forget the cached points of a stage"""
+    with _points_lock:
+        _points_cache.pop(stage_id, None)
@@ -0,0 +1,90 @@
+import json
+import os
+import re
+import secrets
+import tempfile
+import time
+
+# Parsed CSV imports wait here between upload and confirmation. Use a directory
+# shared by all workers when running more than one process.
+STAGING_DIR = os.getenv('IMPORT_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'eurovision-imports'))
+# Seconds a staged import stays valid
+STAGING_TTL = int(os.getenv('IMPORT_STAGING_TTL', '900'))
+
+_TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def _path(token):
+    return os.path.join(STAGING_DIR, f'{token}.jsonl')
+
+
+def purge_expired():
+    """Delete staged imports older than STAGING_TTL"""
+    if not os.path.isdir(STAGING_DIR):
+        return
+    cutoff = time.time() - STAGING_TTL
+    for name in os.listdir(STAGING_DIR):
+        path = os.path.join(STAGING_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+class StagedImport:
+    """Writer for one staged import: rows are appended to disk as they are parsed"""
+
+    def __init__(self, meta):
+        os.makedirs(STAGING_DIR, exist_ok=True)
+        purge_expired()
+        self.token = secrets.token_urlsafe(24)
+        self.count = 0
+        self._temp_path = _path(self.token) + '.tmp'
+        self._file = open(self._temp_path, 'w', encoding='utf-8')
+        self._file.write(json.dumps(meta) + '\n')
+
+    def add(self, row):
+        self._file.write(json.dumps(row) + '\n')
+        self.count += 1
+
+    def commit(self):
+        """Finish writing and make the import available under its token"""
+        self._file.close()
+        os.replace(self._temp_path, _path(self.token))
+        return self.token
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+
+def load_staged(token, user_id):
+    """Return (meta, rows) for a staged import, or None if missing, expired or not the user's"""
+    if not token or not _TOKEN_PATTERN.match(token):
+        return None
+    path = _path(token)
+    try:
+        if os.path.getmtime(path) < time.time() - STAGING_TTL:
+            os.remove(path)
+            return None
+        with open(path, encoding='utf-8') as staged_file:
+            meta = json.loads(staged_file.readline())
+            if meta.get('user_id') != user_id:
+                return None
+            rows = [json.loads(line) for line in staged_file]
+    except (OSError, ValueError):
+        return None
+    return meta, rows
+
+
+def discard_staged(token):
+    """Remove a staged import once it has been applied"""
+    if token and _TOKEN_PATTERN.match(token):
+        try:
+            os.remove(_path(token))
+        except OSError:
+            pass
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+from flask import Response, request
+from .models import db, VersionCounter
+from .grades import dialect_insert
+
+# Counter keys: a stage version changes whenever anything shown on the stage
+# page changes (grades, lineup), a lineup version only when its countries or
+# their order change, and the users version when a user is created
+USERS_KEY = 'users'
+# PostgreSQL channel on which committed version bumps are announced (see invalidation.py)
+NOTIFY_CHANNEL = 'eurovision_versions'
+INVALIDATION_BUS_ENABLED = os.getenv('INVALIDATION_BUS', '1') == '1'
+
+
+def stage_key(stage_id):
+    return f'stage:{stage_id}'
+
+
+def lineup_key(stage_id):
+    return f'lineup:{stage_id}'
+
+
+def bump_versions(*keys):
+    """Increment counters in the current transaction and return {key: new value}.
+
+    Call right before committing the change the counters describe, so the row
+    locks are held as briefly as possible. The caller commits.
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return {}
+    stmt = dialect_insert(VersionCounter)
+    if stmt is None:
+        versions = {}
+        for key in keys:
+            counter = db.session.get(VersionCounter, key, with_for_update=True)
+            if counter is None:
+                counter = VersionCounter(key=key, value=0)
+                db.session.add(counter)
+            counter.value += 1
+            versions[key] = counter.value
+        return versions
+
+    stmt = stmt.values([{'key': key, 'value': 1} for key in keys])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['key'],
+        set_={'value': VersionCounter.value + 1}
+    ).returning(VersionCounter.key, VersionCounter.value)
+    versions = dict(db.session.execute(stmt).all())
+    if INVALIDATION_BUS_ENABLED and db.session.get_bind().dialect.name == 'postgresql':
+        # NOTIFY is transactional: listeners only hear about the bump once it commits
+        db.session.execute(db.text("SELECT pg_notify(:channel, :payload)"),
+                           {'channel': NOTIFY_CHANNEL, 'payload': json.dumps(versions)})
+    return versions
+
+
+def get_versions(*keys):
+    """Return {key: value} for the given counters in one query; missing counters are 0"""
+    versions = dict.fromkeys(keys, 0)
+    versions.update(
+        db.session.query(VersionCounter.key, VersionCounter.value)
+        .filter(VersionCounter.key.in_(keys))
+        .all()
+    )
+    return versions
+
+
+_code_digest = []
+
+
+def _release_digest():
+    """Digest of the app's code and templates, so a deploy invalidates every ETag"""
+    if not _code_digest:
+        digest = hashlib.sha1()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for root, dirs, files in sorted(os.walk(package_dir)):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(('.py', '.html')):
+                    with open(os.path.join(root, name), 'rb') as source:
+                        digest.update(source.read())
+        _code_digest.append(digest.hexdigest())
+    return _code_digest[0]
+
+
+def make_etag(*parts):
+    """Strong ETag for a response that is fully determined by the given versions and identities"""
+    key = '|'.join([_release_digest()] + [str(part) for part in parts])
+    return hashlib.sha1(key.encode()).hexdigest()[:32]
+
+
+def not_modified(etag):
+    """Return a 304 response if the request's If-None-Match matches etag, else None"""
+    if request.if_none_match.contains(etag):
+        return with_etag(Response(status=304), etag)
+    return None
+
+
+def with_etag(response, etag):
+    """Set the ETag and make browsers revalidate the per-user response on every use"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['Vary'] = 'Cookie'
+    return response
+
+
+def version_sum(prefix):
+    """Sum of all counters whose key starts with prefix; changes whenever any of them does"""
+    return db.session.query(db.func.coalesce(db.func.sum(VersionCounter.value), 0)).filter(
+        VersionCounter.key.startswith(prefix)
+    ).scalar()
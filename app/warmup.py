@@ -0,0 +1,41 @@
+import os
+import time
+from .models import db, Stage
+from .scoreboard import get_scoreboard
+from .versions import stage_key, get_versions
+
+# Pooled connections each worker opens before taking traffic
+WARM_CONNECTIONS = int(os.getenv('DB_WARM_CONNECTIONS', '2'))
+# Templates compiled up front so the first requests do not pay for it
+WARM_TEMPLATES = ['base.html', 'index.html', 'stage.html', '_lineup_cells.html', 'user_votes.html', 'analytics.html', 'leaderboard.html', 'fill_db.html']
+
+
+def warm_up(app):
+    """Open pooled connections, build the stage scoreboards and compile templates.
+
+    Called once per worker process after it has loaded the app and before it
+    accepts requests. Failures are reported but never stop the worker.
+    """
+    started = time.perf_counter()
+    with app.app_context():
+        try:
+            # Check out several connections at once so the pool keeps them open
+            connections = [db.engine.connect() for _ in range(WARM_CONNECTIONS)]
+            for connection in connections:
+                connection.close()
+
+            stage_ids = [stage_id for (stage_id,) in db.session.query(Stage.id).all()]
+            # Record the versions the scoreboards reflect so the first requests reuse them
+            versions = get_versions(*[stage_key(stage_id) for stage_id in stage_ids])
+            for stage_id in stage_ids:
+                get_scoreboard(stage_id, versions[stage_key(stage_id)])
+            db.session.remove()
+        except Exception as e:
+            print(f"❌ Error warming up database connections and scoreboards: {str(e)}")
+            return
+
+        for template in WARM_TEMPLATES:
+            app.jinja_env.get_template(template)
+
+    print(f"✅ Worker {os.getpid()} warmed up {len(connections)} connections and "
+          f"{len(stage_ids)} scoreboards in {(time.perf_counter() - started) * 1000:.0f} ms")
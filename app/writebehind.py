@@ -0,0 +1,225 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+from flask import current_app, session
+from sqlalchemy.exc import IntegrityError
+from .models import db
+from .grades import record_vote_batch
+from .scoreboard import apply_votes
+from .live import publish_stage
+from .versions import stage_key, bump_versions
+
+# Set WRITE_BEHIND=1 to acknowledge votes once queued and write them in batches
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND', '0') == '1'
+# Longest time a vote waits in the queue before its batch is written
+FLUSH_INTERVAL = int(os.getenv('WRITE_BEHIND_FLUSH_MS', '50')) / 1000
+# Most votes written in one transaction
+FLUSH_BATCH = int(os.getenv('WRITE_BEHIND_BATCH', '500'))
+# Votes the queue holds before submitters are told to retry
+QUEUE_SIZE = int(os.getenv('WRITE_BEHIND_QUEUE_SIZE', '10000'))
+# Longest pause between attempts while the database is unavailable
+MAX_RETRY_DELAY = 5.0
+# Attempts made for the last batches when shutting down
+SHUTDOWN_ATTEMPTS = 3
+# Seconds a queued vote is shown from the submitter's session at most, in case it was never written
+PENDING_TTL = 60
+
+Vote = namedtuple('Vote', ['seq', 'user_id', 'stage_id', 'country_id', 'value', 'timestamp', 'skip_unchanged'])
+
+
+class BufferFull(Exception):
+    """The vote queue is full; the vote was not accepted and should be retried"""
+
+
+class VoteBuffer:
+    """Bounded in-process queue of acknowledged votes, written by a background thread.
+
+    Votes are flushed in one transaction per batch, at the latest FLUSH_INTERVAL
+    after the first queued vote or as soon as FLUSH_BATCH votes are waiting.
+    Submitters see their queued votes through remember_pending() and
+    pending_grades(), whichever worker serves their next request.
+    """
+
+    def __init__(self, app, capacity=QUEUE_SIZE, batch_size=FLUSH_BATCH, interval=FLUSH_INTERVAL):
+        self.app = app
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.closed = False
+        self.thread = None
+
+    def submit(self, user_id, stage_id, values, skip_unchanged=False):
+        """Queue a user's {country_id: value} votes for one stage, all of them or none.
+
+        Returns the timestamp the votes are written with. Raises BufferFull
+        when the queue has no room for them.
+        """
+        timestamp = datetime.utcnow()
+        with self.condition:
+            if self.closed or len(self.queue) + len(values) > self.capacity:
+                raise BufferFull()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='vote-buffer', daemon=True)
+                self.thread.start()
+            for country_id, value in values.items():
+                self.seq += 1
+                self.queue.append(Vote(self.seq, user_id, stage_id, country_id, value, timestamp, skip_unchanged))
+            self.condition.notify()
+        return timestamp
+
+    def close(self, timeout=30):
+        """Stop accepting votes and write everything still queued"""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+            thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+        if self.queue:
+            print(f"❌ Vote buffer closed with {len(self.queue)} votes still unwritten")
+
+    def _take(self):
+        """Wait for the next batch: FLUSH_INTERVAL after its first vote, or once it is full"""
+        with self.condition:
+            while not self.queue and not self.closed:
+                self.condition.wait()
+            deadline = time.monotonic() + self.interval
+            while len(self.queue) < self.batch_size and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            return [self.queue.popleft() for _ in range(min(len(self.queue), self.batch_size))]
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch:
+                self._write(batch)
+            with self.condition:
+                if self.closed and not self.queue:
+                    return
+
+    def _write(self, batch):
+        """Commit a batch, then update the scoreboards and live rankings of its stages"""
+        written = self._commit(batch)
+        if written is None:
+            return
+        changes, versions = written
+        # The votes are committed: a failure from here on must not write them again
+        with self.app.app_context():
+            for stage_id, stage_changes in changes.items():
+                try:
+                    apply_votes(stage_id, stage_changes, versions[stage_key(stage_id)])
+                    publish_stage(stage_id)
+                except Exception as e:
+                    print(f"❌ Error updating rankings of stage {stage_id} after writing buffered votes: {str(e)}")
+
+    def _commit(self, batch):
+        """Commit a batch in one transaction, retrying while the database is unavailable.
+
+        Returns (changes, versions) of the committed batch, or None when its
+        votes were written one by one or dropped.
+        """
+        delay = 0.1
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                with self.app.app_context():
+                    changes = record_vote_batch(batch)
+                    versions = bump_versions(*[stage_key(stage_id) for stage_id in changes])
+                    db.session.commit()
+                return changes, versions
+            except IntegrityError as e:
+                if len(batch) > 1:
+                    # One bad vote must not hold back the others: write them one by one
+                    for vote in batch:
+                        self._write([vote])
+                    return None
+                print(f"❌ Dropped buffered vote of user {batch[0].user_id} for country "
+                      f"{batch[0].country_id}: {str(e.orig)}")
+                return None
+            except Exception as e:
+                if self.closed and attempts >= SHUTDOWN_ATTEMPTS:
+                    print(f"❌ Lost {len(batch)} buffered votes on shutdown: {str(e)}")
+                    return None
+                print(f"❌ Error writing {len(batch)} buffered votes, retrying in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+
+def remember_pending(stage_id, values, timestamp):
+    """Record queued {country_id: value} votes in the submitter's session.
+
+    The session cookie travels with the user's next request, so any worker
+    can show them their own votes before the batch is written.
+    """
+    pending = session.get('_pending_grades', {})
+    queued = pending.setdefault(str(stage_id), {})
+    for country_id, value in values.items():
+        queued[str(country_id)] = [value, timestamp.isoformat()]
+    session['_pending_grades'] = pending
+
+
+def has_pending(stage_id):
+    """Whether the session holds queued votes for a stage"""
+    return str(stage_id) in session.get('_pending_grades', {})
+
+
+def pending_grades(stage_id, committed):
+    """Return {country_id: value} of the session's queued votes for a stage not written yet.
+
+    committed maps country_id to the (value, timestamp) of the user's current
+    grades. A queued vote is done once a current grade at least as new or
+    with the same value is committed, or after PENDING_TTL seconds; done
+    votes are dropped from the session.
+    """
+    pending = session.get('_pending_grades', {})
+    queued = pending.get(str(stage_id))
+    if not queued:
+        return {}
+    expired = datetime.utcnow() - timedelta(seconds=PENDING_TTL)
+    waiting = {}
+    for key, (value, queued_at) in queued.items():
+        queued_at = datetime.fromisoformat(queued_at)
+        current = committed.get(int(key))
+        if queued_at < expired or (current is not None and (current[0] == value or current[1] >= queued_at)):
+            continue
+        waiting[int(key)] = value
+    if len(waiting) != len(queued):
+        if waiting:
+            pending[str(stage_id)] = {str(country_id): queued[str(country_id)] for country_id in waiting}
+        else:
+            del pending[str(stage_id)]
+        if pending:
+            session['_pending_grades'] = pending
+        else:
+            session.pop('_pending_grades')
+    return waiting
+
+
+def get_vote_buffer():
+    """Return the current app's vote buffer, or None when write-behind is disabled"""
+    return current_app.extensions.get('vote_buffer')
+
+
+def init_write_behind(app):
+    """Enable the write-behind vote buffer when WRITE_BEHIND=1"""
+    if not WRITE_BEHIND_ENABLED:
+        return None
+    buffer = VoteBuffer(app)
+    app.extensions['vote_buffer'] = buffer
+    # Write queued votes before the process exits
+    atexit.register(buffer.close)
+    print(f"✅ WRITE_BEHIND is enabled - votes are written every {int(FLUSH_INTERVAL * 1000)} ms "
+          f"or {FLUSH_BATCH} votes (queue of {QUEUE_SIZE})")
+    return buffer
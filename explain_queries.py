@@ -0,0 +1,69 @@
+"""
+Prints the database query plan for each query on the voting hot path, so you
+can confirm the composite indexes are used.
+
+Usage: python explain_queries.py [stage_id] [user_id]
+Uses EXPLAIN QUERY PLAN on SQLite and EXPLAIN on PostgreSQL.
+"""
+import sys
+from app import create_app
+from app.models import db, Country, CurrentGrade, StageCountry, Grade
+from app.ranking import stage_aggregates_query, voter_summaries_query
+
+
+def hot_queries(stage_id, user_id):
+    """Return (description, query) pairs for the queries run by the voting routes"""
+    return [
+        ("stage(): current grades of the viewing user",
+         db.session.query(CurrentGrade.country_id, CurrentGrade.value)
+         .filter_by(user_id=user_id, stage_id=stage_id)),
+        ("stage(): lineup sorted by performance order",
+         Country.query
+         .join(StageCountry, Country.id == StageCountry.country_id)
+         .filter(StageCountry.stage_id == stage_id)
+         .order_by(StageCountry.order)),
+        ("stage(): votes cast and favourite country of every user",
+         voter_summaries_query(stage_id)),
+        ("scoreboard build: totals per country from current grades",
+         stage_aggregates_query(stage_id)),
+        ("scoreboard check: totals per country from grade history",
+         stage_aggregates_query(stage_id, from_history=True)),
+        ("submit_grades: previous values of the voting user",
+         db.session.query(CurrentGrade.country_id, CurrentGrade.value)
+         .filter(CurrentGrade.user_id == user_id, CurrentGrade.stage_id == stage_id)),
+        ("grade history of one user for one country, newest first",
+         Grade.query
+         .filter_by(user_id=user_id, stage_id=stage_id, country_id=1)
+         .order_by(Grade.timestamp.desc())),
+        ("user_votes(): ballot of one user",
+         db.session.query(Country, CurrentGrade.value)
+         .join(CurrentGrade, CurrentGrade.country_id == Country.id)
+         .filter(CurrentGrade.user_id == user_id, CurrentGrade.stage_id == stage_id)
+         .order_by(CurrentGrade.value.desc())),
+    ]
+
+
+def explain(query):
+    """Return the plan lines for an ORM query or select() on the active database"""
+    dialect = db.engine.dialect
+    statement = getattr(query, 'statement', query)
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+    rows = db.session.execute(db.text(prefix + sql)).fetchall()
+    if dialect.name == 'sqlite':
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+if __name__ == '__main__':
+    app = create_app()
+    stage_id = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    user_id = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    with app.app_context():
+        print(f"\n🔍 Query plans for stage {stage_id}, user {user_id} ({db.engine.dialect.name})")
+        print("==================================================")
+        for description, query in hot_queries(stage_id, user_id):
+            print(f"\n▶ {description}")
+            for line in explain(query):
+                print(f"   {line}")
@@ -1,20 +1,24 @@
 """
 Database initialization script for Eurovision Table application.
 This script can be run directly to populate the database with Eurovision data.
+It is equivalent to `flask init-db --no-seed` followed by `flask seed-db --force`.
 
 Environment variables:
 - USE_REAL_EUROVISION_DATA: Set to '1' to use real Eurovision 2023 data
 """
-from app import app
-from app.db_init import initialize_database
+from app import create_app
+from app.cli import migrate_database, seed_database
 
 if __name__ == '__main__':
+    app = create_app()
     print("\n🎵 Eurovision Table Database Setup Script 🎵")
     print("===========================================")
     print("This script will initialize the database with Eurovision data.")
-    print("You can also set AUTO_INIT_DB=1 in your environment to auto-initialize when the app starts.")
+    print("You can also run `flask init-db` with AUTO_INIT_DB=1 to create and seed an empty database.")
     
     with app.app_context():
-        initialize_database()
+        migrate_database()
+        # Moves the stage and lineup versions too, so running workers drop their cached lineups
+        seed_database(force=True)
         
     print("\nYou can now run the application and start voting!")
@@ -0,0 +1,94 @@
+"""
+Gunicorn configuration for the Eurovision Table application.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden with an environment variable; see the
+Production Serving section of the README for how to size them.
+"""
+import multiprocessing
+import os
+import secrets
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Pre-fork worker processes, each with a pool of threads. Requests are CPU
+# bound, so one worker per core; threads overlap database round trips.
+workers = int(os.getenv('WEB_CONCURRENCY', max(2, multiprocessing.cpu_count())))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+# With gevent (pip install gevent psycogreen) each request is a greenlet, so
+# open live ranking streams cost next to nothing and can stay on
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+else:
+    # An open stream would hold one of the few threads for as long as its tab
+    # stays open, so stage pages poll the rankings instead. Polls are answered
+    # from the invalidation listener's versions, so idle ones never query
+    os.environ.setdefault('LIVE_RANKINGS', 'poll')
+
+# Workers are restarted if a request blocks them for longer than this
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks cannot accumulate
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = 200
+
+# Each worker builds its own app, engine and connection pool after the fork
+preload_app = False
+
+accesslog = '-'
+errorlog = '-'
+
+# Workers must share the session signing key; generate one for this run if unset
+if not os.getenv('SECRET_KEY'):
+    print("⚠️ No SECRET_KEY found, generated a random key shared by all workers of this run")
+    os.environ['SECRET_KEY'] = secrets.token_hex(16)
+
+# Every worker keeps its own scoreboards and only applies the votes it handles
+# itself. The invalidation bus tells each worker about the others' votes;
+# without it, scoreboards are rebuilt from the database regularly instead
+if workers > 1 and os.getenv('INVALIDATION_BUS', '1') != '1':
+    os.environ.setdefault('SCOREBOARD_MAX_AGE', '2')
+# Metrics from all workers are aggregated through snapshot files
+os.environ.setdefault('METRICS_DIR', '/tmp/eurovision-metrics')
+
+
+def on_starting(server):
+    # Start counting from zero: drop snapshots left over from earlier runs
+    from app.metrics import clear_snapshots
+    clear_snapshots()
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # Let PostgreSQL round trips yield to other greenlets instead of blocking the worker
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+
+def post_worker_init(worker):
+    # Open connections and build caches before the worker accepts requests
+    from app.warmup import warm_up
+    warm_up(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    from app.metrics import flush_snapshot
+    flush_snapshot()
+    app = getattr(worker, 'wsgi', None)
+    listener = app.extensions.get('invalidation_listener') if app is not None else None
+    if listener is not None:
+        listener.close()
+    # Write votes still queued by the write-behind buffer before the worker goes away
+    vote_buffer = app.extensions.get('vote_buffer') if app is not None else None
+    if vote_buffer is not None:
+        vote_buffer.close()
+
+
+def child_exit(server, worker):
+    # Keep an exited (e.g. recycled) worker's counters, so a reused PID is not mistaken for it
+    from app.metrics import retire_snapshot
+    retire_snapshot(worker.pid)
@@ -0,0 +1,30 @@
+"""
+Index migration script for Eurovision Table application.
+Creates the composite indexes used by the voting hot path on an existing
+SQLite or PostgreSQL database. Safe to run more than once.
+"""
+from app import create_app
+from app.schema import ensure_indexes
+from app.models import db
+
+if __name__ == '__main__':
+    app = create_app()
+    print("\n🗂️ Eurovision Table Index Migration 🗂️")
+    print("========================================")
+
+    with app.app_context():
+        created = ensure_indexes()
+        if created:
+            for name in created:
+                print(f"✅ Created index {name}")
+        else:
+            print("ℹ️ All indexes already exist - nothing to do")
+
+        if db.engine.dialect.name == 'postgresql':
+            # Refresh planner statistics so the new indexes are considered right away
+            with db.engine.connect() as connection:
+                connection.execute(db.text("ANALYZE"))
+                connection.commit()
+            print("✅ Refreshed planner statistics")
+
+    print("\nRun python explain_queries.py to check the query plans.")
@@ -0,0 +1,59 @@
+import os
+
+# Module-level settings are read on import; keep background listeners out of the tests
+os.environ.setdefault('INVALIDATION_BUS', '0')
+os.environ.setdefault('SECRET_KEY', 'test')
+
+import pytest
+from app import create_app
+from app.models import db, Stage, Country, StageCountry, User
+from app.scoreboard import invalidate_scoreboard
+from app.scoring import invalidate_points_totals
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """App on a fresh SQLite file with one stage of four countries and three users"""
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}")
+    flask_app = create_app()
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        db.create_all()
+        stage = Stage(display_name='Final')
+        db.session.add(stage)
+        for order, name in enumerate(['Sweden', 'Finland', 'Israel', 'Italy'], 1):
+            country = Country(display_name=name, artist=f'{name} artist', song=f'{name} song')
+            db.session.add(country)
+            db.session.flush()
+            db.session.add(StageCountry(stage_id=stage.id, country_id=country.id, order=order))
+        db.session.add_all([User(username=name) for name in ['alice', 'bob', 'carol']])
+        db.session.commit()
+    # Scoreboards and points are cached per process, keyed by stage id
+    invalidate_scoreboard()
+    invalidate_points_totals(1)
+    yield flask_app
+    invalidate_scoreboard()
+    invalidate_points_totals(1)
+
+
+@pytest.fixture
+def lineup(app):
+    """Country ids of stage 1 in performance order"""
+    with app.app_context():
+        return [country_id for (country_id,) in
+                db.session.query(StageCountry.country_id).filter_by(stage_id=1).order_by(StageCountry.order)]
+
+
+@pytest.fixture
+def users(app):
+    """{username: user_id} of the seeded users"""
+    with app.app_context():
+        return dict(db.session.query(User.username, User.id).all())
+
+
+@pytest.fixture
+def client(app):
+    """Test client logged in as alice"""
+    test_client = app.test_client()
+    test_client.post('/', data={'username': 'alice'})
+    return test_client
@@ -0,0 +1,40 @@
+import numpy as np
+from app.analytics import centered_vectors, top_pairs, voting_blocs
+
+
+def test_centered_vectors_give_grade_correlations():
+    matrix = np.array([
+        [12, 8, 4, 1],
+        [11, 7, 4, 2],   # same taste
+        [1, 4, 8, 12],   # opposite taste
+        [12, 0, 0, 0],   # too few grades
+        [6, 6, 6, 6],    # no preference at all
+    ], dtype=np.int16)
+    keep, vectors = centered_vectors(matrix)
+    assert keep.tolist() == [True, True, True, False, False]
+    similarity = vectors @ vectors.T
+    assert np.allclose(np.diag(similarity), 1)
+    assert similarity[0, 1] > 0.9
+    assert similarity[0, 2] < -0.95
+
+
+def test_top_pairs_orders_by_similarity():
+    similarity = np.array([
+        [1.0, 0.2, -0.5],
+        [0.2, 1.0, 0.9],
+        [-0.5, 0.9, 1.0],
+    ])
+    assert top_pairs(similarity, 2) == [(1, 2, 0.9), (0, 1, 0.2)]
+    assert top_pairs(similarity, 1, highest=False) == [(0, 2, -0.5)]
+    assert top_pairs(np.ones((1, 1)), 3) == []
+
+
+def test_voting_blocs_separate_opposite_tastes():
+    rng = np.random.default_rng(7)
+    taste = np.array([12, 10, 8, 6, 4, 2], dtype=np.float64)
+    grades = np.vstack([taste + rng.integers(-1, 2, (8, 6)), taste[::-1] + rng.integers(-1, 2, (8, 6))])
+    _, vectors = centered_vectors(np.clip(grades, 1, 12).astype(np.int16))
+    labels = voting_blocs(vectors)
+    assert len(set(labels[:8])) == 1
+    assert len(set(labels[8:])) == 1
+    assert labels[0] != labels[8]
@@ -0,0 +1,33 @@
+from app.models import db, Country, CurrentGrade
+from app.grades import record_grade
+
+XHR = {'X-Requested-With': 'XMLHttpRequest'}
+
+
+def test_votes_for_countries_outside_the_lineup_are_refused(app, client, lineup):
+    with app.app_context():
+        outsider = Country(display_name='Norway', artist='Norway artist', song='Norway song')
+        db.session.add(outsider)
+        db.session.commit()
+        outsider_id = outsider.id
+
+    refused = client.post(f'/stage/1/submit/{outsider_id}', data={'grade': 10}, headers=XHR).get_json()
+    assert refused['success'] is False
+    assert client.post(f'/stage/1/submit/{lineup[0]}', data={'grade': 10}, headers=XHR).get_json()['success']
+    with app.app_context():
+        assert CurrentGrade.query.filter_by(country_id=outsider_id).count() == 0
+
+
+def test_ballots_only_list_grades_of_the_lineup(app, client, lineup, users):
+    with app.app_context():
+        outsider = Country(display_name='Norway', artist='Norway artist', song='Norway song')
+        db.session.add(outsider)
+        db.session.flush()
+        # A grade left behind, e.g. by a country later removed from the stage
+        record_grade(users['alice'], 1, outsider.id, 10)
+        record_grade(users['alice'], 1, lineup[1], 7)
+        db.session.commit()
+
+    ballots = {ballot['username']: ballot for ballot in client.get('/api/v1/stages/1/ballots').get_json()['data']}
+    assert ballots['alice']['votes'] == 1
+    assert ballots['alice']['grades'] == [[lineup[1], 7]]
@@ -0,0 +1,18 @@
+from app.models import db, Grade, CurrentGrade
+
+
+def test_migrate_db_upgrades_a_database_without_the_newer_tables(app, lineup, users):
+    with app.app_context():
+        db.session.add(Grade(user_id=users['alice'], stage_id=1, country_id=lineup[0], value=9))
+        db.session.commit()
+        for table in ('current_grade', 'version_counter', 'grade_archive'):
+            db.session.execute(db.text(f'DROP TABLE {table}'))
+        db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['migrate-db'])
+    assert result.exception is None, result.output
+
+    with app.app_context():
+        tables = set(db.inspect(db.engine).get_table_names())
+        assert {'current_grade', 'version_counter', 'grade_archive'} <= tables
+        assert [(grade.country_id, grade.value) for grade in CurrentGrade.query.all()] == [(lineup[0], 9)]
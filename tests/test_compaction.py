@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+from app.models import db, Grade, GradeArchive
+from app.compaction import compact_grades
+
+
+def test_only_grades_superseded_before_the_cutoff_are_archived(app, lineup, users):
+    now = datetime.utcnow()
+    cutoff = now - timedelta(minutes=60)
+    with app.app_context():
+        def grade(user, country_id, value, ago):
+            row = Grade(user_id=users[user], stage_id=1, country_id=country_id, value=value, timestamp=now - ago)
+            db.session.add(row)
+            db.session.flush()
+            return row.id
+
+        replaced_long_ago = grade('alice', lineup[0], 3, timedelta(hours=3))
+        just_replaced = grade('alice', lineup[0], 5, timedelta(hours=2))
+        latest = grade('alice', lineup[0], 8, timedelta(minutes=5))
+        # The latest grade of a key stays, however old it is
+        only_grade = grade('alice', lineup[1], 4, timedelta(hours=3))
+        # Equal timestamps are ordered by id, as latest_grades_subquery does
+        tied_first = grade('bob', lineup[0], 6, timedelta(hours=3))
+        tied_latest = grade('bob', lineup[0], 7, timedelta(hours=3))
+        db.session.commit()
+
+        assert compact_grades(cutoff, batch_size=1) == 2
+        assert compact_grades(cutoff, batch_size=1) == 0
+        archived = {row.id: row.value for row in GradeArchive.query.all()}
+        assert archived == {replaced_long_ago: 3, tied_first: 6}
+        assert {row.id for row in Grade.query.all()} == {just_replaced, latest, only_grade, tied_latest}
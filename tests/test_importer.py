@@ -0,0 +1,25 @@
+from app.importer import import_lineup
+from app.versions import stage_key, lineup_key, get_versions
+
+
+def row(position, country, artist, song):
+    return {'position': str(position), 'country': country, 'artist': artist, 'song': song}
+
+
+def test_changed_songs_move_the_versions_of_every_stage_showing_them(app, client):
+    with app.app_context():
+        semi, _ = import_lineup('Semi-final 1', [row(1, 'Sweden', 'Loreen', 'Tattoo')])
+        semi_id = semi.id
+    page = client.get(f'/stage/{semi_id}')
+    assert 'Tattoo' in page.get_data(as_text=True)
+    etag = page.headers['ETag']
+    with app.app_context():
+        before = get_versions(stage_key(semi_id), lineup_key(semi_id))
+        _, stats = import_lineup('Final', [row(1, 'Sweden', 'Loreen', 'Tattoo FIXED')])
+        after = get_versions(stage_key(semi_id), lineup_key(semi_id))
+    assert stats['countries_updated'] == 1
+    assert all(after[key] == before[key] + 1 for key in before)
+
+    page = client.get(f'/stage/{semi_id}', headers={'If-None-Match': etag})
+    assert page.status_code == 200
+    assert 'Tattoo FIXED' in page.get_data(as_text=True)
@@ -0,0 +1,41 @@
+from sqlalchemy import event
+from app.models import db
+from app.grades import record_grade
+from app.invalidation import InvalidationListener
+from app.versions import stage_key, bump_versions
+
+
+def test_polls_are_answered_from_the_listeners_versions(app, client, lineup, users):
+    listener = InvalidationListener(app)
+    app.extensions['invalidation_listener'] = listener
+    with app.app_context():
+        listener._sync()
+
+    first = client.get('/stage/1/rankings')
+    assert first.status_code == 200
+
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    count = lambda *args: statements.append(args[2])
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        unchanged = client.get('/stage/1/rankings', headers={'If-None-Match': first.headers['ETag']})
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert unchanged.status_code == 304
+    assert statements == []
+
+    with app.app_context():
+        record_grade(users['bob'], 1, lineup[0], 12)
+        version = bump_versions(stage_key(1))[stage_key(1)]
+        db.session.commit()
+        listener._sync()
+    changed = client.get('/stage/1/rankings', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.get_json()['version'] == version
+    assert changed.get_json()['rankings'][0]['total_grade'] == 12
+
+    # Without a connected listener the version is read from the database
+    listener.synced = False
+    assert client.get('/stage/1/rankings', headers={'If-None-Match': changed.headers['ETag']}).status_code == 304
@@ -0,0 +1,91 @@
+import threading
+from app.models import db
+from app.grades import record_grade
+from app.ranking import stage_totals
+from app.scoreboard import get_scoreboard, apply_votes, loaded_version
+from app.versions import stage_key, bump_versions, get_versions
+
+
+def commit_vote(user_id, country_id, value):
+    """Record a vote the way submit_grades does; returns (previous_value, stage_version)"""
+    previous = record_grade(user_id, 1, country_id, value)
+    version = bump_versions(stage_key(1))[stage_key(1)]
+    db.session.commit()
+    return previous, version
+
+
+def test_apply_after_rebuild_does_not_double_count(app, lineup, users):
+    with app.app_context():
+        get_scoreboard(1)
+        previous, version = commit_vote(users['alice'], lineup[0], 10)
+        # Another request rebuilds the scoreboard between our commit and our apply
+        get_scoreboard(1, version)
+        apply_votes(1, [(lineup[0], previous, 10)], version)
+        assert get_scoreboard(1).snapshot() == (version, stage_totals(1))
+        assert stage_totals(1) == [(lineup[0], 10)]
+
+
+def test_apply_follows_the_next_version(app, lineup, users):
+    with app.app_context():
+        board = get_scoreboard(1)
+        previous, version = commit_vote(users['alice'], lineup[1], 7)
+        assert apply_votes(1, [(lineup[1], previous, 7)], version) == version
+        assert get_scoreboard(1) is board
+        assert board.snapshot() == (version, stage_totals(1))
+
+
+def test_apply_drops_a_scoreboard_that_missed_a_change(app, lineup, users):
+    with app.app_context():
+        get_scoreboard(1)
+        # A change committed by another process that this one never applied
+        commit_vote(users['bob'], lineup[2], 5)
+        previous, version = commit_vote(users['alice'], lineup[2], 8)
+        assert apply_votes(1, [(lineup[2], previous, 8)], version) is None
+        assert loaded_version(1) is None
+        assert get_scoreboard(1).snapshot() == (version, stage_totals(1))
+
+
+def test_concurrent_votes_and_rebuilds_match_stage_totals(app, lineup, users):
+    # SQLite has a single writer, so commits are serialized; applies and rebuilds are not
+    write_lock = threading.Lock()
+    errors = []
+
+    def voter(user_id, offset):
+        try:
+            with app.app_context():
+                for step in range(30):
+                    country_id = lineup[(step + offset) % len(lineup)]
+                    value = (step * 5 + offset) % 12 + 1
+                    with write_lock:
+                        previous, version = commit_vote(user_id, country_id, value)
+                    apply_votes(1, [(country_id, previous, value)], version)
+        except Exception as e:
+            errors.append(e)
+
+    def reader(stop):
+        try:
+            with app.app_context():
+                while not stop.is_set():
+                    get_scoreboard(1, get_versions(stage_key(1))[stage_key(1)]).snapshot()
+                    db.session.remove()
+        except Exception as e:
+            errors.append(e)
+
+    with app.app_context():
+        get_scoreboard(1)
+    stop = threading.Event()
+    readers = [threading.Thread(target=reader, args=(stop,)) for _ in range(2)]
+    voters = [threading.Thread(target=voter, args=(user_id, offset))
+              for offset, user_id in enumerate(users.values())]
+    for thread in readers + voters:
+        thread.start()
+    for thread in voters:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    assert not errors
+    with app.app_context():
+        version = get_versions(stage_key(1))[stage_key(1)]
+        assert get_scoreboard(1).snapshot() == (version, stage_totals(1))
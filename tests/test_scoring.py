@@ -0,0 +1,59 @@
+import numpy as np
+from app.models import db
+from app.grades import record_grades
+from app.scoring import eurovision_points, points_totals
+
+
+def cast(app, users, ballots):
+    """Commit {username: {country_id: grade}} ballots for stage 1"""
+    with app.app_context():
+        for username, grades in ballots.items():
+            record_grades(users[username], 1, grades)
+        db.session.commit()
+
+
+def test_eurovision_points_break_equal_grades_by_performance_order():
+    matrix = np.array([
+        [5, 5, 0, 3],
+        [1, 2, 3, 4],
+    ], dtype=np.int16)
+    assert eurovision_points(matrix).tolist() == [
+        [12, 10, 0, 8],
+        [7, 8, 10, 12],
+    ]
+
+
+def test_eurovision_points_only_go_to_the_top_ten():
+    matrix = np.arange(1, 12, dtype=np.int16).reshape(1, 11)
+    points = eurovision_points(matrix)[0]
+    assert points.tolist() == [0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 12]
+
+
+def test_equal_totals_go_to_the_country_with_more_voters(app, lineup, users):
+    cast(app, users, {
+        'alice': {lineup[0]: 12, lineup[1]: 11, lineup[3]: 10},
+        'bob': {lineup[0]: 12, lineup[1]: 11, lineup[3]: 10},
+        'carol': {lineup[1]: 12, lineup[2]: 11, lineup[3]: 10},
+    })
+    with app.app_context():
+        # lineup[0] has 24 points from two voters, lineup[3] 24 from three
+        assert points_totals(1) == [(lineup[1], 32), (lineup[3], 24), (lineup[0], 24), (lineup[2], 10)]
+
+
+def test_equal_totals_and_voters_go_to_the_country_with_more_twelves(app, lineup, users):
+    cast(app, users, {
+        'alice': {lineup[2]: 12, lineup[0]: 11, lineup[1]: 5},
+        'bob': {lineup[3]: 12, lineup[0]: 11, lineup[2]: 10},
+    })
+    with app.app_context():
+        # lineup[0] gets 10 + 10, lineup[2] gets 12 + 8
+        assert points_totals(1) == [(lineup[2], 20), (lineup[0], 20), (lineup[3], 12), (lineup[1], 8)]
+
+
+def test_full_ties_go_to_the_earlier_performance(app, lineup, users):
+    cast(app, users, {
+        'alice': {lineup[1]: 12, lineup[0]: 11},
+        'bob': {lineup[0]: 12, lineup[1]: 11},
+    })
+    with app.app_context():
+        assert points_totals(1) == [(lineup[0], 22), (lineup[1], 22)]
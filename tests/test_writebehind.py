@@ -0,0 +1,117 @@
+import re
+from datetime import datetime, timedelta
+from flask import session
+from app import create_app
+from app.models import db, Grade, CurrentGrade
+from app.ranking import stage_totals
+from app.scoreboard import get_scoreboard
+from app.versions import stage_key, get_versions
+from app.writebehind import VoteBuffer, remember_pending, pending_grades
+
+
+def shown_grades(response):
+    """{country_id: value} of the grade inputs filled in on a stage page"""
+    html = response.get_data(as_text=True)
+    return {int(country_id): int(value) for value, country_id in
+            re.findall(r'value="(\d*)"\s+class="form-control text-center grade-input" data-country-id="(\d+)"', html)
+            if value}
+
+
+def current_grades(app, user_id):
+    with app.app_context():
+        return dict(db.session.query(CurrentGrade.country_id, CurrentGrade.value)
+                    .filter_by(user_id=user_id, stage_id=1).all())
+
+
+def test_flush_writes_batches_and_updates_the_scoreboard(app, lineup, users):
+    buffer = VoteBuffer(app, interval=0.01)
+    with app.app_context():
+        get_scoreboard(1)
+    timestamp = buffer.submit(users['alice'], 1, {lineup[0]: 5, lineup[1]: 8})
+    buffer.submit(users['alice'], 1, {lineup[0]: 9})
+    buffer.submit(users['bob'], 1, {lineup[0]: 12}, skip_unchanged=True)
+    buffer.close()
+
+    assert current_grades(app, users['alice']) == {lineup[0]: 9, lineup[1]: 8}
+    assert current_grades(app, users['bob']) == {lineup[0]: 12}
+    with app.app_context():
+        history = Grade.query.filter_by(user_id=users['alice'], country_id=lineup[1]).all()
+        assert [grade.timestamp for grade in history] == [timestamp]
+        version = get_versions(stage_key(1))[stage_key(1)]
+        assert get_scoreboard(1).snapshot() == (version, stage_totals(1))
+        assert stage_totals(1) == [(lineup[0], 21), (lineup[1], 8)]
+
+
+def test_queued_votes_are_shown_by_another_worker(app, client, lineup):
+    buffer = VoteBuffer(app, interval=60)
+    app.extensions['vote_buffer'] = buffer
+    try:
+        response = client.post('/stage/1/ballot', json={'grades': {str(lineup[0]): 7, str(lineup[2]): 3}})
+        assert response.get_json()['saved'] == 2
+
+        # A second app plays the part of another worker process without the queue
+        other = create_app()
+        other.config.update(TESTING=True)
+        other_client = other.test_client()
+        other_client.set_cookie('session', client.get_cookie('session').value)
+        assert shown_grades(other_client.get('/stage/1')) == {lineup[0]: 7, lineup[2]: 3}
+    finally:
+        buffer.interval = 0
+        buffer.close()
+
+    # Once written, the grades come from the database and leave the session,
+    # so the page can be answered with an ETag again
+    assert shown_grades(other_client.get('/stage/1')) == {lineup[0]: 7, lineup[2]: 3}
+    with other_client.session_transaction() as cookie_session:
+        assert '_pending_grades' not in cookie_session
+    assert other_client.get('/stage/1').headers.get('ETag') is not None
+
+
+def test_ballot_counts_only_queued_grades(app, client, lineup):
+    buffer = VoteBuffer(app, interval=60)
+    app.extensions['vote_buffer'] = buffer
+    try:
+        ballot = {str(lineup[0]): 7, str(lineup[1]): 4}
+        assert client.post('/stage/1/ballot', json={'grades': ballot}).get_json()['saved'] == 2
+        # Same grades again while still queued: nothing new to queue
+        assert client.post('/stage/1/ballot', json={'grades': ballot}).get_json()['saved'] == 0
+        ballot[str(lineup[1])] = 6
+        assert client.post('/stage/1/ballot', json={'grades': ballot}).get_json()['saved'] == 1
+        assert len(buffer.queue) == 3
+    finally:
+        buffer.interval = 0
+        buffer.close()
+
+
+def test_pending_grades_are_dropped_once_committed_or_expired(app, lineup):
+    now = datetime.utcnow()
+    with app.test_request_context():
+        remember_pending(1, {lineup[0]: 7, lineup[1]: 4, lineup[2]: 9}, now)
+        committed = {
+            lineup[0]: (5, now - timedelta(seconds=1)),  # older grade: the queued vote is still waiting
+            lineup[1]: (4, now),                          # written
+        }
+        assert pending_grades(1, committed) == {lineup[0]: 7, lineup[2]: 9}
+        assert set(session['_pending_grades']['1']) == {str(lineup[0]), str(lineup[2])}
+
+        remember_pending(1, {lineup[3]: 2}, now - timedelta(minutes=5))
+        assert lineup[3] not in pending_grades(1, committed)
+
+
+def test_a_failure_after_the_commit_does_not_write_the_batch_again(app, lineup, users, monkeypatch):
+    failures = []
+
+    def publish_once(stage_id):
+        if not failures:
+            failures.append(stage_id)
+            raise RuntimeError('broadcaster unavailable')
+
+    monkeypatch.setattr('app.writebehind.publish_stage', publish_once)
+    buffer = VoteBuffer(app, interval=0.01)
+    buffer.submit(users['alice'], 1, {lineup[0]: 10})
+    buffer.close()
+
+    assert failures == [1]
+    with app.app_context():
+        assert Grade.query.filter_by(user_id=users['alice'], country_id=lineup[0]).count() == 1
+        assert stage_totals(1) == [(lineup[0], 10)]
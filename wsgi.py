@@ -0,0 +1,10 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Run `flask --app app init-db` first: building the app does not touch the database.
+"""
+from app import create_app
+
+app = create_app()